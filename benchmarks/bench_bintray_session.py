@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+    bench_bintray_session.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+
+    Compares the per-request latency of Bintray uploads made with one-off
+    `requests.put` calls against uploads sharing a pooled keep-alive session.
+    Runs against a local fake Bintray API, so the difference shown is the cost
+    of TCP connection setup alone; against api.bintray.com every new
+    connection also pays a TLS handshake.
+
+    Usage: python benchmarks/bench_bintray_session.py [requests]
+"""
+
+
+from __future__ import print_function
+
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+import release_manager.targets.bintray as bintray
+
+
+class FakeBintrayHandler(BaseHTTPRequestHandler):
+    """Accepts every upload, keeping the connection alive"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"message":"success"}'
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the upload logging while timing"""
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def run(count, artifact_path, session):
+    """Returns the mean latency in milliseconds of `count` uploads"""
+    start = time.time()
+    with quiet():
+        for i in range(count):
+            bintray.upload_bintray_artifact(
+                "0.1.0", "package", "generic", "org", "user", "key",
+                "artifact_%s.zip" % i, artifact_path, "0", "0", False, session
+            )
+    return (time.time() - start) * 1000 / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    server = HTTPServer(("127.0.0.1", 0), FakeBintrayHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    bintray.BINTRAY_API_URL = "http://127.0.0.1:%s" % server.server_port
+
+    artifact = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
+    artifact.write(os.urandom(64 * 1024))
+    artifact.close()
+
+    try:
+        unpooled = run(count, artifact.name, requests)
+        pooled = run(count, artifact.name, bintray.create_session())
+    finally:
+        server.shutdown()
+        os.remove(artifact.name)
+
+    print("Requests per mode      : %s" % count)
+    print("requests.put (no pool) : %.3f ms/request" % unpooled)
+    print("pooled session         : %.3f ms/request" % pooled)
+    print("Speedup                : %.2fx" % (unpooled / pooled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+    bench_checksums.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+
+
+    Compares hashing a release set one file at a time with buffered reads
+    (as `checksum.file_digests` does) against `checksum.hash_files`, which
+    memory-maps the files and hashes each of them in a single pass on a pool
+    of threads. Both compute the md5, sha256 and sha512 of every file.
+
+    Usage: python benchmarks/bench_checksums.py [files] [megabytes per file]
+"""
+
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import release_manager.checksum as checksum
+
+
+ALGORITHMS = ('md5', 'sha256', 'sha512')
+
+
+def timed(function):
+    """Returns the seconds taken by the function, starting from an empty
+    digests memo"""
+    checksum._digests.clear()
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    megabytes = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(count):
+            path = os.path.join(work_dir, "artifact_%s.zip" % i)
+            with open(path, "wb") as stream:
+                for _ in range(megabytes):
+                    stream.write(os.urandom(1024 * 1024))
+            paths.append(path)
+
+        sequential = timed(lambda: [checksum.file_digests(path, ALGORITHMS) for path in paths])
+        pooled = timed(lambda: checksum.hash_files(paths, ALGORITHMS))
+
+        print("Release set           : %s file(s) of %s MB" % (count, megabytes))
+        print("Sequential reads      : %.2fs" % sequential)
+        print("mmap + thread pool    : %.2fs" % pooled)
+        print("Speedup               : %.2fx" % (sequential / pooled))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+    bench_startup.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+
+    Measures the wall-clock startup time of `release-manager --version` and
+    of a `--check-version` run against a config with an S3 target, and
+    lists the target SDKs each of them ends up importing.
+
+    Usage: python benchmarks/bench_startup.py [runs]
+"""
+
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+local:
+  root_dir: %s
+targets:
+  - type: awss3
+    access_key_id: key
+    secret_access_key: secret
+packages:
+  - repo: generic
+    name: package
+    user_org: org
+    publish: true
+    override: false
+    continue_on_conflict: false
+    version: 0.1.0
+    build_version: 0.1.0
+    artifacts: []
+"""
+
+# Runs the CLI in-process so the imported modules can be listed afterwards
+RUNNER = """
+import sys
+import release_manager.__main__ as main
+try:
+    main.main()
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(m for m in ('boto3', 'botocore', 'requests') if m in sys.modules))
+"""
+
+
+def run(args, count):
+    """Returns the mean duration in milliseconds of `count` runs and the
+    target SDKs imported by the last one"""
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    imported = ""
+    start = time.time()
+    for _ in range(count):
+        process = subprocess.Popen(
+            [sys.executable, "-c", RUNNER] + args,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+        )
+        _, imported = process.communicate()
+        if process.returncode != 0:
+            raise ValueError("release-manager %s failed" % " ".join(args))
+    return (time.time() - start) * 1000 / count, imported.decode("utf-8").strip() or "none"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        config_path = os.path.join(work_dir, "config.yml")
+        with open(config_path, "w") as stream:
+            stream.write(CONFIG % work_dir)
+
+        for name, args in [("--version", ["--version"]), ("--check-version", ["--config", config_path, "--check-version"])]:
+            duration, imported = run(args, count)
+            print("%-16s %8.1f ms  (imports: %s)" % (name, duration, imported))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
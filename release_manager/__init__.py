@@ -3,6 +3,15 @@
 import release_manager.targets
 import release_manager.__main__
 import release_manager._version
+import release_manager.archive
+import release_manager.builder
+import release_manager.cache
+import release_manager.checksum
+import release_manager.journal
 import release_manager.logger
+import release_manager.manifest
 import release_manager.package
+import release_manager.planner
+import release_manager.retry
+import release_manager.scheduler
 import release_manager.utils
@@ -21,13 +21,15 @@
 
 import argparse
 
-import release_manager.targets.bintray as bintray
-import release_manager.targets.awss3 as s3
+import release_manager.targets as targets
 
 import release_manager._version as _version
 import release_manager.logger as logger
 import release_manager.utils as utils
+import release_manager.journal as journal
 import release_manager.package as pack
+import release_manager.planner as planner
+import release_manager.scheduler as scheduler
 
 
 # --- Main
@@ -41,6 +43,8 @@ def main():
     parser.add_argument("--make-artifact", action='store_true', default=False, help="makes the artifacts that will be uploaded")
     parser.add_argument("--upload-artifact", action='store_true', default=False, help="uploads the artifacts to the targets")
     parser.add_argument("--check-version", action='store_true', default=False, help="checks that the version specified matches the build")
+    parser.add_argument("--resume", action='store_true', default=False, help="skips the packages and uploads completed by a previous run of the same config")
+    parser.add_argument("--jobs", type=int, default=1, help="the number of packages to build concurrently")
     parser.add_argument("--version", action='version', version=_version.__version__)
     args = parser.parse_args()
 
@@ -58,25 +62,67 @@ def main():
 
     logger.log_header("Starting Package uploader...")
 
-    # Upload packages
-    for package in config["packages"]:
-
-        logger.log_start("Processing package %s" % package["name"])
-
-        # Check the versions
-        if args.check_version:
+    # Check the versions
+    if args.check_version:
+        for package in config["packages"]:
+            logger.log_start("Checking version of package %s" % package["name"])
             pack.check_version(package["version"], package["build_version"])
 
-        # Push to targets
-        for target in config['targets']:
-            if target['type'] == 'bintray':
-                bintray.deploy_to_bintray(args, config['local'], package, target)
-            elif target['type'] == 'awss3':
-                s3.upload_to_s3(args, config['local'], package, target)
-            else:
-                raise ValueError("Invalid target specified; expected one of [bintray, awss3] and got %s" % target["type"])
-
-        logger.log_footer("Finished processing package %s!" % package["name"])
+    # Load the targets before doing any work, only when they are used
+    if not args.make_version and not args.make_artifact:
+        logger.log_footer("Finished checking %s package(s)!" % len(config["packages"]))
+        return
+    target_modules = [targets.get_target(target['type']) for target in config['targets']]
+    concurrency = config["local"].get("upload_concurrency", scheduler.DEFAULT_CONCURRENCY)
+    scheduler.limit_targets(config['targets'], concurrency)
+
+    # Skip the packages completed by a previous run
+    packages = config["packages"]
+    release_journal = journal.open_journal(config["local"]["root_dir"], args.config, packages, args.resume)
+    if args.resume:
+        packages = journal.get_pending_packages(release_journal, packages)
+        logger.log_start("Resuming from %s" % release_journal.path)
+        logger.log_info("%s of %s package(s) already released" % (len(config["packages"]) - len(packages), len(config["packages"])))
+
+    # Build every package once
+    plans = planner.create_plan(args, config["local"], packages)
+
+    # Prepare the targets and collect every independent transfer, leaving
+    # out the ones the journal records as completed
+    transfers = []
+    package_transfers = []
+    for plan in plans:
+        logger.log_start("Processing package %s" % plan.package["name"])
+        plan_transfers = []
+        for index, (target, target_module) in enumerate(zip(config['targets'], target_modules)):
+            target_module.prepare(args, plan.package, target)
+            target_transfers = target_module.get_transfers(args, plan.package, target, plan.artifacts)
+            plan_transfers.extend(target_transfers)
+            transfers.extend(journal.resume_transfers(release_journal, plan.package, index, target_transfers))
+        package_transfers.append((plan.package, plan_transfers))
+
+    resumed = sum(len(plan_transfers) for _, plan_transfers in package_transfers) - len(transfers)
+    if resumed:
+        logger.log_start("Skipping %s transfer(s) completed by a previous run" % resumed)
+
+    # Push to targets
+    results = []
+    if transfers:
+        logger.log_start("Running %s transfer(s) with concurrency %s" % (len(transfers), concurrency))
+        results = scheduler.TransferScheduler(concurrency).run(transfers)
+
+    # Packages are only completed once all of their artifacts are uploaded
+    if args.upload_artifact:
+        for package, plan_transfers in package_transfers:
+            if all(transfer.result is not None and transfer.result.success for transfer in plan_transfers):
+                release_journal.complete(package)
+
+    if results:
+        failed = scheduler.report(results)
+        if failed:
+            raise ValueError("%s of %s transfer(s) failed" % (len(failed), len(results)))
+
+    logger.log_footer("Finished processing %s package(s)!" % len(plans))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+"""
+    archive.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import os
+import sys
+import zipfile
+import zlib
+
+import release_manager.logger as logger
+
+
+# --- Constants
+
+
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# ZipFile only accepts a compression level from Python 3.7
+SUPPORTS_COMPRESSION_LEVEL = sys.version_info >= (3, 7)
+
+AVAILABLE_COMPRESSIONS = ['auto', 'deflate', 'store']
+
+# Formats that are already compressed and that deflate barely shrinks
+INCOMPRESSIBLE_EXTENSIONS = (
+    '.jar', '.war', '.ear', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.zst',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff', '.woff2', '.mp3', '.mp4'
+)
+
+SAMPLE_SIZE = 64 * 1024
+
+# Members whose samples deflate by less than this ratio are stored as-is
+MIN_COMPRESSION_SAVING = 0.1
+
+
+# --- Functions
+
+
+def write_zip(archive_path, members, compression_level=DEFAULT_COMPRESSION_LEVEL, compression='auto'):
+    """Streams every (source_path, archive_name) member straight into a new zip
+    archive. Members larger than 4GB are stored with ZIP64 extensions. The
+    archive is written next to its final path and moved into place once
+    complete, so an interrupted build never leaves a truncated archive.
+
+    With 'auto' compression, members that are already compressed are stored
+    instead of deflated; 'deflate' and 'store' apply to every member"""
+    if compression_level is not None and not 0 <= compression_level <= 9:
+        raise ValueError("Invalid compression level; expected 0-9 and got %s" % compression_level)
+    if compression not in AVAILABLE_COMPRESSIONS:
+        raise ValueError("Invalid compression specified; expected one of %s and got %s" % (AVAILABLE_COMPRESSIONS, compression))
+
+    validate_members(archive_path, members)
+
+    if not SUPPORTS_COMPRESSION_LEVEL and compression_level not in (None, DEFAULT_COMPRESSION_LEVEL):
+        logger.log_info("WARNING: compression level %s of %s is ignored; Python %s.%s always deflates at level %s, use Python 3.7+ to set it" % (
+            compression_level, os.path.basename(archive_path), sys.version_info[0], sys.version_info[1], DEFAULT_COMPRESSION_LEVEL))
+
+    temp_path = "%s.part" % archive_path
+    try:
+        with _open_zip(temp_path, compression_level) as archive:
+            for source_path, archive_name in members:
+                archive.write(source_path, archive_name, get_compress_type(source_path, compression))
+        os.rename(temp_path, archive_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def validate_members(archive_path, members):
+    """Checks every (source_path, archive_name) member exists and has a
+    unique name within the archive"""
+    names = set()
+    for source_path, archive_name in members:
+        if not os.path.isfile(source_path):
+            raise ValueError("Cannot add %s to %s: no such file" % (source_path, archive_path))
+        if archive_name in names:
+            raise ValueError("Cannot add %s to %s: duplicate name %s" % (source_path, archive_path, archive_name))
+        names.add(archive_name)
+
+
+def get_compress_type(path, compression):
+    """Returns the zipfile compression method to use for a member"""
+    if compression == 'store' or (compression == 'auto' and not is_compressible(path)):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def is_compressible(path):
+    """Guesses whether deflating a file is worth it, first from its extension
+    and otherwise by compressing a sample from its start and middle"""
+    if path.lower().endswith(INCOMPRESSIBLE_EXTENSIONS):
+        return False
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return True
+
+    with open(path, 'rb') as fp:
+        sample = fp.read(SAMPLE_SIZE)
+        if size > 2 * SAMPLE_SIZE:
+            fp.seek(size // 2)
+            sample += fp.read(SAMPLE_SIZE)
+
+    saving = 1 - len(zlib.compress(sample, 1)) / float(len(sample))
+    return saving >= MIN_COMPRESSION_SAVING
+
+
+def _open_zip(path, compression_level):
+    if SUPPORTS_COMPRESSION_LEVEL:
+        return zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=compression_level)
+    return zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
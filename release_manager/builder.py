@@ -0,0 +1,139 @@
+"""
+    builder.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import threading
+
+import release_manager.package as pack
+import release_manager.utils as utils
+
+
+# --- Classes
+
+
+class BuildRunner(object):
+    """Runs the build commands of every package as a dependency graph. A
+    package is built once all the packages in its `depends_on` list are, and
+    at most `jobs` packages are built at the same time. The first failure
+    terminates the running commands and stops any further build"""
+    def __init__(self, root_dir, packages, jobs=1):
+        if jobs < 1:
+            raise ValueError("Build jobs must be at least 1; got %s" % jobs)
+        validate_dependencies(packages)
+        self.root_dir = root_dir
+        self.packages = packages
+        self.jobs = jobs
+        self._condition = threading.Condition()
+        self._abort = threading.Event()
+        self._pending = []
+        self._done = set()
+        self._error = None
+
+    def run(self):
+        """Builds every package, raising the first build error"""
+        self._pending = list(self.packages)
+        self._done = set()
+        self._error = None
+        self._abort.clear()
+
+        workers = []
+        for _ in range(min(self.jobs, len(self._pending))):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(0.5)
+        except BaseException:
+            self._abort.set()
+            utils.terminate_running()
+            raise
+
+        if self._error is not None:
+            raise self._error
+
+    def _next(self):
+        """Pops the first pending package whose dependencies are all built,
+        waiting for a running build to finish if there is none"""
+        with self._condition:
+            while self._pending and self._error is None:
+                for position, package in enumerate(self._pending):
+                    if all(dependency in self._done for dependency in package.get("depends_on", [])):
+                        del self._pending[position]
+                        return package
+                self._condition.wait()
+            return None
+
+    def _work(self):
+        while True:
+            package = self._next()
+            if package is None:
+                return
+
+            try:
+                if "build_commands" in package.keys():
+                    pack.execute_build(self.root_dir, package, self._abort)
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                if error is None:
+                    self._done.add(package["name"])
+                elif self._error is None:
+                    self._error = ValueError("Build of package %s failed: %s" % (package["name"], error))
+                    self._abort.set()
+                    utils.terminate_running()
+                self._condition.notify_all()
+
+
+# --- Functions
+
+
+def validate_dependencies(packages):
+    """Fails if a package depends on an unknown package or if the
+    dependencies contain a cycle"""
+    if not any("depends_on" in package for package in packages):
+        return
+
+    names = [package["name"] for package in packages]
+    if len(set(names)) != len(names):
+        raise ValueError("Package names must be unique to build with dependencies")
+
+    remaining = dict((package["name"], set(package.get("depends_on", []))) for package in packages)
+    for name, dependencies in remaining.items():
+        unknown = dependencies.difference(names)
+        if unknown:
+            raise ValueError("Package %s depends on unknown package(s) %s" % (name, sorted(unknown)))
+
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies.intersection(remaining)]
+        if not ready:
+            raise ValueError("Package dependencies contain a cycle between %s" % sorted(remaining))
+        for name in ready:
+            del remaining[name]
+
+
+def run_builds(root_dir, packages, jobs=1):
+    """Runs the build commands of all packages, see `BuildRunner`"""
+    BuildRunner(root_dir, packages, jobs).run()
@@ -0,0 +1,77 @@
+"""
+    cache.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import json
+import os
+
+import release_manager.checksum as checksum
+
+
+# --- Functions
+
+
+def load_manifest(path):
+    """Returns the manifest stored at the path, or None if there is no
+    readable manifest there"""
+    try:
+        with open(path, 'r') as stream:
+            return json.load(stream)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_manifest(path, manifest):
+    """Writes the manifest atomically, so a crash never leaves half of it"""
+    temp_path = "%s.tmp" % path
+    with open(temp_path, 'w') as stream:
+        json.dump(manifest, stream, indent=2, sort_keys=True)
+    os.rename(temp_path, path)
+
+
+def fingerprint_file(path, previous=None):
+    """Returns the path, size, mtime and sha256 of a file. The hash of the
+    previous fingerprint is reused when the size and mtime did not change"""
+    stat = os.stat(path)
+    fingerprint = {
+        'path': path,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime
+    }
+    if previous is not None and all(previous.get(k) == fingerprint[k] for k in ('path', 'size', 'mtime')):
+        fingerprint['sha256'] = previous.get('sha256')
+    else:
+        fingerprint['sha256'] = checksum.file_digests(path, ('sha256',))['sha256']
+    return fingerprint
+
+
+def fingerprint_files(paths, previous=None):
+    """Fingerprints every file, reusing the hashes of a previous manifest"""
+    previous_by_path = dict((f['path'], f) for f in (previous or []))
+    return [fingerprint_file(path, previous_by_path.get(path)) for path in paths]
+
+
+def same_content(fingerprints, other_fingerprints):
+    """Whether two lists of fingerprints describe the same files and content"""
+    if other_fingerprints is None:
+        return False
+    return [(f['path'], f['size'], f['sha256']) for f in fingerprints] == \
+        [(f.get('path'), f.get('size'), f.get('sha256')) for f in other_fingerprints]
@@ -0,0 +1,183 @@
+"""
+    checksum.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import functools
+import hashlib
+import mmap
+import multiprocessing
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+# --- Constants
+
+
+CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_ALGORITHMS = ('md5', 'sha256')
+
+
+# --- Classes
+
+
+class HashingReader(object):
+    """Wraps a binary file, hashing the bytes as they are read through it, so
+    that a file can be hashed while it is being uploaded. Once the file has
+    been read to its end, its digests are stored for `file_digests`"""
+    def __init__(self, fp, path, algorithms=DEFAULT_ALGORITHMS):
+        self.fp = fp
+        self.path = path
+        self.algorithms = algorithms
+        self._hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+        self._digests = None
+
+    def read(self, size=-1):
+        chunk = self.fp.read(size)
+        for digest in self._hashes:
+            digest.update(chunk)
+        if (not chunk or size is None or size < 0) and self._digests is None:
+            self._digests = dict((algorithm, digest.hexdigest()) for algorithm, digest in zip(self.algorithms, self._hashes))
+            store_digests(self.path, self._digests)
+        return chunk
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Rewinding (as a resent request does) starts hashing over; any other
+        # seek would skip bytes, so the digests are not kept
+        position = self.fp.seek(offset, whence)
+        if self.fp.tell() == 0:
+            self._hashes = [hashlib.new(algorithm) for algorithm in self.algorithms]
+            self._digests = None
+        else:
+            self._digests = {}
+        return position
+
+    def __getattr__(self, name):
+        # Anything else (fileno, mode, tell...) is the wrapped file's
+        return getattr(self.fp, name)
+
+    def digests(self):
+        """Returns the digests of the file, or None if it was not read to its end"""
+        return self._digests or None
+
+
+# --- Functions
+
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def _digests_key(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime
+
+
+def cached_digests(path, algorithms=DEFAULT_ALGORITHMS):
+    """Returns the digests of a file if they are already known, or None"""
+    with _digests_lock:
+        known = _digests.get(_digests_key(path), {})
+    if not all(algorithm in known for algorithm in algorithms):
+        return None
+    return dict((algorithm, known[algorithm]) for algorithm in algorithms)
+
+
+def store_digests(path, digests):
+    """Remembers the digests of a file computed while reading it elsewhere"""
+    key = _digests_key(path)
+    with _digests_lock:
+        _digests.setdefault(key, {}).update(digests)
+
+
+def file_digests(path, algorithms=DEFAULT_ALGORITHMS):
+    """Returns the hex digests of a file keyed by algorithm. Files are hashed
+    once per run; a file is hashed again only if its size or mtime changed"""
+    known = cached_digests(path, algorithms)
+    if known is not None:
+        return known
+
+    hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+            for digest in hashes:
+                digest.update(chunk)
+
+    result = dict((algorithm, digest.hexdigest()) for algorithm, digest in zip(algorithms, hashes))
+    store_digests(path, result)
+    return result
+
+
+def mmap_digests(path, algorithms=DEFAULT_ALGORITHMS):
+    """Returns the hex digests of a file keyed by algorithm, computed in a
+    single pass over a memory map of the file. Chunks are handed to hashlib
+    as views of the map rather than copied into new bytes objects"""
+    hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+    size = os.path.getsize(path)
+    if size > 0:
+        with open(path, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                _hash_map(mapped, size, hashes)
+            finally:
+                mapped.close()
+    return dict((algorithm, digest.hexdigest()) for algorithm, digest in zip(algorithms, hashes))
+
+
+def _hash_map(mapped, size, hashes):
+    """Feeds every chunk of the map to each of the hashes"""
+    try:
+        view = memoryview(mapped)
+    except TypeError:
+        # Python 2 maps only expose the old buffer interface
+        for offset in range(0, size, CHUNK_SIZE):
+            chunk = buffer(mapped, offset, CHUNK_SIZE)  # noqa: F821
+            for digest in hashes:
+                digest.update(chunk)
+        return
+
+    try:
+        for offset in range(0, size, CHUNK_SIZE):
+            chunk = view[offset:offset + CHUNK_SIZE]
+            for digest in hashes:
+                digest.update(chunk)
+            # The map cannot be closed while a view of it is alive
+            chunk.release()
+    finally:
+        view.release()
+
+
+def hash_files(paths, algorithms=DEFAULT_ALGORITHMS, threads=None):
+    """Returns the digests of every file keyed by path. Files are hashed on
+    a pool of threads sized to the cores, as hashlib releases the GIL while
+    hashing, each in a single pass computing every algorithm. Digests already
+    known are not computed again, and new ones are stored for `file_digests`"""
+    missing = [path for path in paths if cached_digests(path, algorithms) is None]
+    if missing:
+        pool = ThreadPool(min(threads or multiprocessing.cpu_count(), len(missing)))
+        try:
+            results = pool.map(functools.partial(mmap_digests, algorithms=algorithms), missing)
+        finally:
+            pool.close()
+            pool.join()
+        for path, result in zip(missing, results):
+            store_digests(path, result)
+    return dict((path, cached_digests(path, algorithms)) for path in paths)
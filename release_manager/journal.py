@@ -0,0 +1,156 @@
+"""
+    journal.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import functools
+import hashlib
+import os
+import threading
+
+import release_manager.cache as cache
+import release_manager.checksum as checksum
+import release_manager.package as pack
+import release_manager.scheduler as scheduler
+
+
+# --- Constants
+
+
+JOURNAL_NAME = ".journal-%s.json"
+
+
+# --- Classes
+
+
+class Journal(object):
+    """Records the release steps completed for a config, so that a resumed run
+    can skip them. A step is one artifact of a package sent to one target
+    location, and stays completed while the artifact keeps the same digest.
+    Packages are completed once every one of their steps is"""
+    def __init__(self, path, steps=None, packages=None):
+        self.path = path
+        self.steps = steps or {}
+        self.packages = packages or []
+        self._lock = threading.Lock()
+
+    def get_status(self, step, artifact_path):
+        """Returns the status a step was completed with for the current
+        content of the artifact, or None if it was not. The artifact is only
+        hashed for steps found in the journal"""
+        entry = self.steps.get(step)
+        if entry is None or entry.get('sha256') != checksum.file_digests(artifact_path)['sha256']:
+            return None
+        return entry.get('status')
+
+    def record(self, step, digest, status):
+        """Records a completed step"""
+        with self._lock:
+            self.steps[step] = {'sha256': digest, 'status': status}
+            self._save()
+
+    def is_complete(self, package):
+        return package["name"] in self.packages
+
+    def complete(self, package):
+        """Records a package whose steps are all completed"""
+        with self._lock:
+            if package["name"] not in self.packages:
+                self.packages.append(package["name"])
+                self._save()
+
+    def _save(self):
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        cache.save_manifest(self.path, {'steps': self.steps, 'packages': self.packages})
+
+
+# --- Functions
+
+
+def get_journal_path(root_dir, config_path, packages):
+    """Returns the path of the journal of a config, named after the hash of
+    the config and of the versions of its packages"""
+    digest = hashlib.sha256()
+    with open(config_path, 'rb') as stream:
+        digest.update(stream.read())
+    for package in packages:
+        digest.update(("%s=%s\n" % (package["name"], package["version"])).encode('utf-8'))
+    return "%s/%s/%s" % (root_dir, pack.ARTIFACT_STAGING_DIR, JOURNAL_NAME % digest.hexdigest()[:16])
+
+
+def open_journal(root_dir, config_path, packages, resume=False):
+    """Returns the journal of a config. The steps of a previous run are only
+    kept when resuming; otherwise the journal starts over"""
+    path = get_journal_path(root_dir, config_path, packages)
+    previous = (cache.load_manifest(path) if resume else None) or {}
+    return Journal(path, previous.get('steps'), previous.get('packages'))
+
+
+def get_pending_packages(journal, packages):
+    """Returns the packages that are not completed, along with the completed
+    packages they depend on so that their builds still run first"""
+    by_name = dict((package["name"], package) for package in packages)
+    needed = set()
+    stack = [package["name"] for package in packages if not journal.is_complete(package)]
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack.extend(by_name[name].get("depends_on", []) if name in by_name else [])
+    return [package for package in packages if package["name"] in needed]
+
+
+def get_step(package, target_index, transfer):
+    """Returns the journal key of a transfer"""
+    location = "" if transfer.location is None else str(transfer.location)
+    return " | ".join([
+        package["name"],
+        transfer.artifact["artifact_name"],
+        "%s#%s" % (transfer.target["type"], target_index),
+        location
+    ])
+
+
+def resume_transfers(journal, package, target_index, transfers):
+    """Returns the transfers that still have to run. Transfers completed in
+    the journal are given the result they were recorded with instead; the
+    others record themselves in the journal once they succeed"""
+    pending = []
+    for transfer in transfers:
+        if transfer.artifact is None:
+            pending.append(transfer)
+            continue
+
+        step = get_step(package, target_index, transfer)
+        status = journal.get_status(step, transfer.artifact["artifact_path"])
+        if status is None:
+            transfer.action = functools.partial(_record, journal, step, transfer.artifact["artifact_path"], transfer.action)
+            pending.append(transfer)
+        else:
+            transfer.result = scheduler.TransferResult(transfer, status=status)
+    return pending
+
+
+def _record(journal, step, artifact_path, action):
+    # Uploads hash the artifacts they send, so this rarely reads it again
+    status = action() or scheduler.UPLOADED
+    journal.record(step, checksum.file_digests(artifact_path)['sha256'], status)
+    return status
@@ -53,8 +53,11 @@ def log_info(info):
         print(" + %s" % info)
 
 
-def log_output(output):
+def log_output(output, prefix=None):
     """Styling for an output log statement"""
     if output != "":
         for line in output.splitlines():
-            print("   - %s" % line)
+            if prefix:
+                print("   - [%s] %s" % (prefix, line))
+            else:
+                print("   - %s" % line)
@@ -0,0 +1,106 @@
+"""
+    manifest.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import os
+
+import release_manager.checksum as checksum
+import release_manager.logger as logger
+import release_manager.package as pack
+
+
+# --- Constants
+
+
+MANIFEST_NAMES = {
+    'sha256': 'SHA256SUMS',
+    'sha512': 'SHA512SUMS'
+}
+
+
+# --- Functions
+
+
+def get_algorithms(package):
+    """Returns the algorithms of the checksum manifests asked for by the
+    package `checksums` option: true for sha256 alone, or a list"""
+    checksums = package.get("checksums")
+    if not checksums:
+        return []
+    if checksums is True:
+        return ['sha256']
+
+    algorithms = [checksums] if not isinstance(checksums, list) else checksums
+    unknown = set(algorithms).difference(MANIFEST_NAMES)
+    if unknown:
+        raise ValueError("Invalid checksums specified; expected any of %s and got %s" % (sorted(MANIFEST_NAMES), sorted(unknown)))
+    return algorithms
+
+
+def get_manifest_name(package, algorithm):
+    return "%s_%s_%s" % (package["name"], package["version"], MANIFEST_NAMES[algorithm])
+
+
+def write_manifest(path, digests):
+    """Writes `<digest>  <artifact name>` lines, sorted by name. The file is
+    left untouched when its content would not change"""
+    content = "".join("%s  %s\n" % (digests[name], name) for name in sorted(digests))
+    if os.path.isfile(path):
+        with open(path, 'r') as stream:
+            if stream.read() == content:
+                return
+
+    temp_path = "%s.tmp" % path
+    with open(temp_path, 'w') as stream:
+        stream.write(content)
+    os.rename(temp_path, path)
+
+
+def create_manifests(root_dir, plans, threads=None):
+    """Writes the checksum manifests of every package that asks for them into
+    its staging directory, and adds them to its artifacts so that they are
+    uploaded next to them. The artifacts of all packages are hashed together
+    on a pool of threads, along with the digests the targets need later"""
+    requested = [(plan, get_algorithms(plan.package)) for plan in plans]
+    requested = [(plan, algorithms) for plan, algorithms in requested if algorithms and plan.artifacts]
+    if not requested:
+        return
+
+    paths = sorted(set(artifact["artifact_path"] for plan, _ in requested for artifact in plan.artifacts))
+    algorithms = sorted(set(checksum.DEFAULT_ALGORITHMS).union(*[algorithms for _, algorithms in requested]))
+
+    logger.log_start("Hashing %s artifact(s) for checksum manifests" % len(paths))
+    digests = checksum.hash_files(paths, algorithms, threads)
+
+    for plan, plan_algorithms in requested:
+        folder = "%s/%s/%s" % (root_dir, pack.ARTIFACT_STAGING_DIR, plan.package["name"])
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        manifests = []
+        for algorithm in plan_algorithms:
+            name = get_manifest_name(plan.package, algorithm)
+            path = "%s/%s" % (folder, name)
+            write_manifest(path, dict((artifact["artifact_name"], digests[artifact["artifact_path"]][algorithm]) for artifact in plan.artifacts))
+            logger.log_info("Wrote %s" % name)
+            manifests.append({'artifact_name': name, 'artifact_path': path})
+        plan.artifacts.extend(manifests)
+    logger.log_done()
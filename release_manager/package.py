@@ -21,9 +21,16 @@
 
 
 from __future__ import print_function
+import errno
+import functools
+import glob
 import os
 import os.path
+import threading
+import time
 
+import release_manager.archive as archive
+import release_manager.cache as cache
 import release_manager.logger as logger
 import release_manager.utils as utils
 
@@ -35,11 +42,13 @@ ARTIFACT_STAGING_DIR = "dist"
 
 AVAILABLE_ARTIFACT_TYPES = ['zip', 'asis']
 
+BUILD_FINGERPRINTS = ".build_fingerprints"
+
 
 # --- Functions
 
 
-def create_zip_artifact(root_dir, version, package, artifact_prefix, artifact_suffix, binary_paths):
+def create_zip_artifact(root_dir, version, package, artifact_prefix, artifact_suffix, binary_paths, compression_level=archive.DEFAULT_COMPRESSION_LEVEL, compression='auto'):
     """Builds the artifact for upload"""
 
     artifact_root = "%s%s%s" % (artifact_prefix, version, artifact_suffix,)
@@ -49,25 +58,60 @@ def create_zip_artifact(root_dir, version, package, artifact_prefix, artifact_su
     logger.log_info("Building artifact %s..." % artifact_name)
 
     artifact_folder = "%s/%s/%s" % (root_dir, ARTIFACT_STAGING_DIR, package)
-    utils.execute(['mkdir', '-p', artifact_folder])
+    make_dirs(artifact_folder)
+
+    artifact_path = "%s/%s" % (artifact_folder, artifact_name)
+    members = [(os.path.join(root_dir, path), os.path.basename(path)) for path in binary_paths]
+    archive.validate_members(artifact_path, members)
+
+    # Reuse the archive of a previous run if neither its inputs nor options changed
+    manifest_path = "%s/.%s.manifest" % (artifact_folder, artifact_name)
+    previous = cache.load_manifest(manifest_path) or {}
+    options = {
+        'names': [name for _, name in members],
+        'compression_level': compression_level,
+        'compression': compression
+    }
+    inputs = cache.fingerprint_files([source for source, _ in members], previous.get('inputs'))
 
-    file_names = []
-    for path in binary_paths:
-        utils.execute(['cp', path, artifact_folder])
-        file_names.append(os.path.basename(path))
+    if previous.get('options') == options and cache.same_content(inputs, previous.get('inputs')) and is_unchanged(artifact_path, previous.get('artifact')):
+        logger.log_info("Inputs unchanged, reusing cached artifact %s" % artifact_name)
+    else:
+        archive.write_zip(artifact_path, members, compression_level, compression)
 
-    os.chdir(artifact_folder)
-    utils.execute(['zip', artifact_name] + file_names)
-    os.chdir(root_dir)
+    stat = os.stat(artifact_path)
+    cache.save_manifest(manifest_path, {
+        'inputs': inputs,
+        'options': options,
+        'artifact': {'size': stat.st_size, 'mtime': stat.st_mtime}
+    })
 
     logger.log_done()
 
     return {
         'artifact_name': artifact_name,
-        'artifact_path': "%s/%s" % (artifact_folder, artifact_name)
+        'artifact_path': artifact_path
     }
 
 
+def make_dirs(path):
+    """Creates a directory and its parents, unless another process creating
+    the artifacts of the same package already did"""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def is_unchanged(artifact_path, previous):
+    """Whether an artifact is still the one recorded in its cache manifest"""
+    if previous is None or not os.path.isfile(artifact_path):
+        return False
+    stat = os.stat(artifact_path)
+    return previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime
+
+
 def create_asis_artifact(root_dir, version, package, artifact_prefix, artifact_suffix, binary_paths):
     """Construct artifact name and perform no operations"""
 
@@ -81,12 +125,17 @@ def create_asis_artifact(root_dir, version, package, artifact_prefix, artifact_s
     }
 
 
-def create_artifact(root_dir, version, package, artifact_type, artifact_prefix, artifact_suffix, binary_paths):
+def create_artifact(root_dir, version, package, artifact_type, artifact_prefix, artifact_suffix, binary_paths, compression_level=None, compression=None):
     """Builds the artifact for upload"""
     logger.log_start("Creating artifact for package %s" % package)
 
+    if compression_level is None:
+        compression_level = archive.DEFAULT_COMPRESSION_LEVEL
+    if compression is None:
+        compression = 'auto'
+
     if artifact_type == 'zip':
-        result = create_zip_artifact(root_dir, version, package, artifact_prefix, artifact_suffix, binary_paths)
+        result = create_zip_artifact(root_dir, version, package, artifact_prefix, artifact_suffix, binary_paths, compression_level, compression)
     elif artifact_type == 'asis':
         result = create_asis_artifact(root_dir, version, package, artifact_prefix, artifact_suffix, binary_paths)
     else:
@@ -105,9 +154,77 @@ def check_version(version, build_version):
     logger.log_done()
 
 
-def execute_commands(commands):
-    """Execute build commands"""
-    logger.log_start("Executing build commands")
+def execute_commands(commands, cwd=None, prefix=None, abort=None):
+    """Execute build commands, prefixing their output when given a prefix.
+    Remaining commands are not started once the abort event is set"""
+    logger.log_start("Executing build commands" + (" for %s" % prefix if prefix else ""))
     for command in commands:
-        utils.execute([command], shell=True)
+        if abort is not None and abort.is_set():
+            raise ValueError("Build aborted before running [%s]" % command)
+        utils.execute([command], functools.partial(utils.output_everything, prefix=prefix), shell=True, cwd=cwd, isolate=True)
     logger.log_done()
+
+
+_fingerprints_lock = threading.Lock()
+
+
+def execute_build(root_dir, package, abort=None):
+    """Execute the build commands of a package in its `working_dir` (relative
+    to root_dir). Packages declaring their `build_inputs` are not rebuilt if
+    the inputs hash the same as on the last successful build and every
+    `build_outputs` pattern still matches a file"""
+    commands = package["build_commands"]
+    cwd = os.path.join(root_dir, package["working_dir"]) if "working_dir" in package else None
+    if "build_inputs" not in package:
+        execute_commands(commands, cwd, package["name"], abort)
+        return
+
+    store_path = "%s/%s/%s" % (root_dir, ARTIFACT_STAGING_DIR, BUILD_FINGERPRINTS)
+    with _fingerprints_lock:
+        previous = (cache.load_manifest(store_path) or {}).get(package["name"], {})
+
+    inputs = cache.fingerprint_files(expand_globs(root_dir, package["build_inputs"]), previous.get('inputs'))
+    outputs = package.get("build_outputs", [])
+
+    if previous.get('commands') == commands and cache.same_content(inputs, previous.get('inputs')) \
+            and all(_glob(os.path.join(root_dir, output)) for output in outputs):
+        logger.log_start("Build inputs of package %s unchanged, skipping build commands" % package["name"])
+        logger.log_info("Saved %.1fs" % previous.get('duration', 0))
+        logger.log_done()
+        return
+
+    start = time.time()
+    execute_commands(commands, cwd, package["name"], abort)
+    duration = time.time() - start
+
+    with _fingerprints_lock:
+        store = cache.load_manifest(store_path) or {}
+        store[package["name"]] = {
+            'commands': commands,
+            'inputs': inputs,
+            'duration': duration
+        }
+        if not os.path.isdir(os.path.dirname(store_path)):
+            os.makedirs(os.path.dirname(store_path))
+        cache.save_manifest(store_path, store)
+
+
+def expand_globs(root_dir, patterns):
+    """Returns the sorted files matched by glob patterns relative to root_dir.
+    Raises if a pattern matches no file, as a typo would otherwise leave the
+    inputs unchanged forever"""
+    paths = set()
+    for pattern in patterns:
+        matches = [path for path in _glob(os.path.join(root_dir, pattern)) if os.path.isfile(path)]
+        if not matches:
+            raise ValueError("Invalid build_inputs pattern %s: it matches no file in %s" % (pattern, root_dir))
+        paths.update(matches)
+    return sorted(paths)
+
+
+def _glob(pattern):
+    try:
+        return glob.glob(pattern, recursive=True)
+    except TypeError:
+        # Python 2 has no recursive globbing
+        return glob.glob(pattern)
@@ -0,0 +1,101 @@
+"""
+    planner.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import multiprocessing
+
+import release_manager.builder as builder
+import release_manager.logger as logger
+import release_manager.manifest as manifest
+import release_manager.package as pack
+
+
+class PackagePlan(object):
+    """Entity storing the artifacts built for a package. Created once by
+    `create_plan` and handed to every target"""
+    def __init__(self, package, artifacts):
+        self.package = package
+        self.artifacts = artifacts
+
+    def __str__(self):
+        return "Package [{}] with {} artifact(s)".format(self.package['name'], len(self.artifacts))
+
+
+def get_artifact_jobs(local, package):
+    """Returns the `create_artifact` arguments of every artifact of a package"""
+    return [(
+        local["root_dir"],
+        package["version"],
+        package["name"],
+        artifact["type"],
+        artifact["prefix"],
+        artifact["suffix"],
+        artifact["binary_paths"],
+        artifact.get("compression_level"),
+        artifact.get("compression")
+    ) for artifact in package["artifacts"]]
+
+
+def _create_artifact(job):
+    return pack.create_artifact(*job)
+
+
+def create_artifacts(jobs, processes=None):
+    """Creates every artifact on a pool of `processes` worker processes,
+    defaulting to one per core. Results are returned in job order"""
+    processes = min(processes or multiprocessing.cpu_count(), len(jobs))
+    if processes <= 1:
+        return [_create_artifact(job) for job in jobs]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        artifacts = pool.map(_create_artifact, jobs)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return artifacts
+
+
+def create_plan(args, local, packages):
+    """Builds the artifacts of every package exactly once, regardless of
+    how many targets they are going to be sent to. Build commands run first,
+    following the package dependencies, then the artifacts of all packages
+    are created in parallel, and finally their checksum manifests"""
+    if not args.make_artifact:
+        return [PackagePlan(package, []) for package in packages]
+
+    logger.log_start("Building %s package(s) with %s job(s)" % (len(packages), args.jobs))
+    builder.run_builds(local["root_dir"], packages, args.jobs)
+
+    jobs = [get_artifact_jobs(local, package) for package in packages]
+
+    artifacts = create_artifacts([job for package_jobs in jobs for job in package_jobs], local.get("artifact_concurrency"))
+
+    plans = []
+    for package, package_jobs in zip(packages, jobs):
+        plans.append(PackagePlan(package, artifacts[:len(package_jobs)]))
+        artifacts = artifacts[len(package_jobs):]
+
+    manifest.create_manifests(local["root_dir"], plans, local.get("checksum_concurrency"))
+    return plans
@@ -0,0 +1,153 @@
+"""
+    retry.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+from __future__ import division
+
+import random
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+import release_manager.logger as logger
+
+
+# --- Constants
+
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+DEFAULT_BACKOFF_BASE = 1.0
+
+DEFAULT_BACKOFF_CAP = 30.0
+
+# Retry-After delays asked by a server are followed up to this many seconds
+MAX_RETRY_AFTER = 300
+
+RETRY_SETTINGS = ['max_attempts', 'backoff_base', 'backoff_cap', 'jitter']
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Responses meaning the server refused the request without processing it,
+# which makes even a non-idempotent request safe to send again
+REJECTED_STATUS_CODES = (429, 503)
+
+
+# --- Classes
+
+
+class RetryableError(Exception):
+    """Raised by an operation failing for a transient reason. `retry_after`
+    is the delay asked by the server, `rejected` whether it is known not to
+    have processed the request and `result` what the attempt returned"""
+    def __init__(self, message, retry_after=None, rejected=False, result=None):
+        super(RetryableError, self).__init__(message)
+        self.retry_after = retry_after
+        self.rejected = rejected
+        self.result = result
+
+
+class RetryPolicy(object):
+    """Runs operations again when they raise a RetryableError, waiting an
+    exponential backoff between attempts. With full jitter each wait is
+    drawn between 0 and the backoff, so that concurrent transfers do not
+    retry in lockstep. Non-idempotent operations are only run again when
+    the server rejected them"""
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff_base=DEFAULT_BACKOFF_BASE, backoff_cap=DEFAULT_BACKOFF_CAP, jitter=True, sleep=time.sleep):
+        if max_attempts < 1:
+            raise ValueError("Retry max_attempts must be at least 1; got %s" % max_attempts)
+        if backoff_base < 0 or backoff_cap < 0:
+            raise ValueError("Retry backoff must not be negative; got base %s and cap %s" % (backoff_base, backoff_cap))
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.sleep = sleep
+
+    def get_delay(self, attempt, retry_after=None):
+        """Returns the wait before running an operation again after its
+        `attempt`th attempt failed. A Retry-After delay is never shortened"""
+        backoff = min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(0, backoff) if self.jitter else backoff
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, MAX_RETRY_AFTER))
+        return delay
+
+    def call(self, operation, description, idempotent=True):
+        """Returns the result of the operation, retrying it on transient
+        errors. The last error is raised once the attempts run out"""
+        attempt = 1
+        while True:
+            try:
+                return operation()
+            except RetryableError as e:
+                if attempt >= self.max_attempts or not (idempotent or e.rejected):
+                    raise
+                delay = self.get_delay(attempt, e.retry_after)
+                logger.log_info("%s failed (%s), retrying in %.1fs (attempt %s of %s)" % (description, e, delay, attempt + 1, self.max_attempts))
+                _count_retry()
+                self.sleep(delay)
+                attempt += 1
+
+
+# --- Functions
+
+
+def get_policy(target):
+    """Returns the retry policy configured in the `retry` section of a target"""
+    settings = target.get('retry') or {}
+    unknown = set(settings).difference(RETRY_SETTINGS)
+    if unknown:
+        raise ValueError("Invalid retry settings %s; expected any of %s" % (sorted(unknown), RETRY_SETTINGS))
+    return RetryPolicy(**settings)
+
+
+def parse_retry_after(value, now=None):
+    """Returns the seconds to wait from a Retry-After header holding either
+    seconds or an HTTP date, or None if there is no usable value"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, mktime_tz(parsed) - (time.time() if now is None else now))
+
+
+# Retries are counted per thread, so that each transfer can report its own
+_counts = threading.local()
+
+
+def _count_retry():
+    _counts.retries = get_retries() + 1
+
+
+def reset_retries():
+    """Starts counting the retries of the current thread from zero"""
+    _counts.retries = 0
+
+
+def get_retries():
+    """Returns the retries made by the current thread since the last reset"""
+    return getattr(_counts, 'retries', 0)
@@ -0,0 +1,186 @@
+"""
+    scheduler.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import threading
+import time
+
+import release_manager.logger as logger
+import release_manager.retry as retry
+
+
+# --- Constants
+
+
+DEFAULT_CONCURRENCY = 4
+
+UPLOADED = "uploaded"
+UP_TO_DATE = "up to date"
+SKIPPED = "skipped"
+
+
+# --- Classes
+
+
+class Transfer(object):
+    """Entity storing a single upload of an artifact to a target (and location).
+    Created by the targets `get_transfers` functions. A transfer that
+    `depends_on` another one is only started once that one has finished, and
+    can read its outcome from its `result`"""
+    def __init__(self, target, description, action, depends_on=None, artifact=None, location=None):
+        self.target = target
+        self.description = description
+        self.action = action
+        self.depends_on = depends_on
+        self.artifact = artifact
+        self.location = location
+        self.result = None
+
+    def __str__(self):
+        return self.description
+
+
+class TransferResult(object):
+    """Entity storing the outcome of a single transfer. The status is the value
+    returned by the transfer action, one of UPLOADED, UP_TO_DATE or SKIPPED,
+    and retries the number of operations it had to run again"""
+    def __init__(self, transfer, error=None, duration=0.0, status=UPLOADED, retries=0):
+        self.transfer = transfer
+        self.error = error
+        self.duration = duration
+        self.status = status
+        self.retries = retries
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def __str__(self):
+        retries = ", {} retries".format(self.retries) if self.retries else ""
+        if self.success:
+            return "{} - {} ({:.2f}s{})".format(self.transfer, self.status.upper(), self.duration, retries)
+        return "{} - FAILED ({}{})".format(self.transfer, self.error, retries)
+
+
+class TransferScheduler(object):
+    """Runs independent transfers on a pool of worker threads. At most
+    `concurrency` transfers run at once overall, and at most
+    `upload_concurrency` (when set) for any single target. Transfers that
+    others depend on are started first, so that their dependents can start
+    as early as possible"""
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        if concurrency < 1:
+            raise ValueError("Upload concurrency must be at least 1; got %s" % concurrency)
+        self.concurrency = concurrency
+        self._condition = threading.Condition()
+        self._pending = []
+        self._active = {}
+        self._results = []
+
+    def run(self, transfers):
+        """Runs all transfers and returns their results in submission order"""
+        for transfer in transfers:
+            if transfer.depends_on is not None and transfer.depends_on not in transfers and transfer.depends_on.result is None:
+                raise ValueError("Transfer %s depends on a transfer that is never run" % transfer)
+            limit = transfer.target.get('upload_concurrency')
+            if limit is not None and limit < 1:
+                raise ValueError("Upload concurrency of %s target must be at least 1; got %s" % (transfer.target.get('type'), limit))
+
+        dependencies = set(id(transfer.depends_on) for transfer in transfers if transfer.depends_on is not None)
+        self._pending = sorted(enumerate(transfers), key=lambda pending: id(pending[1]) not in dependencies)
+        self._active = {}
+        self._results = []
+
+        workers = []
+        for _ in range(min(self.concurrency, len(self._pending))):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+
+        return [result for _, result in sorted(self._results, key=lambda r: r[0])]
+
+    def _has_capacity(self, target):
+        limit = target.get('upload_concurrency')
+        return limit is None or self._active.get(id(target), 0) < limit
+
+    def _is_ready(self, transfer):
+        return transfer.depends_on is None or transfer.depends_on.result is not None
+
+    def _next(self):
+        """Pops the first pending transfer whose dependency has finished and
+        whose target has spare capacity, waiting for a running transfer to
+        finish if there is none"""
+        with self._condition:
+            while self._pending:
+                for position, (index, transfer) in enumerate(self._pending):
+                    if self._is_ready(transfer) and self._has_capacity(transfer.target):
+                        self._active[id(transfer.target)] = self._active.get(id(transfer.target), 0) + 1
+                        del self._pending[position]
+                        return index, transfer
+                self._condition.wait()
+            return None, None
+
+    def _work(self):
+        while True:
+            index, transfer = self._next()
+            if transfer is None:
+                return
+
+            start = time.time()
+            status = None
+            retry.reset_retries()
+            try:
+                status = transfer.action() or UPLOADED
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                self._active[id(transfer.target)] -= 1
+                transfer.result = TransferResult(transfer, error, time.time() - start, status, retry.get_retries())
+                self._results.append((index, transfer.result))
+                self._condition.notify_all()
+
+
+# --- Functions
+
+
+def limit_targets(targets, concurrency):
+    """Sets the `upload_concurrency` of every target to the number of its
+    transfers that can actually run at once, which the overall concurrency
+    caps. Targets size their connection pools from it"""
+    for target in targets:
+        target['upload_concurrency'] = min(concurrency, target.get('upload_concurrency', concurrency))
+
+
+def report(results):
+    """Logs the outcome of every transfer and returns the failed ones"""
+    logger.log_start("Transfer summary")
+    for result in results:
+        logger.log_info(str(result))
+    retries = sum(result.retries for result in results)
+    if retries:
+        logger.log_info("%s operation(s) retried" % retries)
+    logger.log_done()
+    return [result for result in results if not result.success]
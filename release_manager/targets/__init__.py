@@ -1,4 +1,18 @@
 """release_manager.targets: __init__.py declaration"""
 
-import release_manager.targets.awss3
-import release_manager.targets.bintray
+import importlib
+
+
+# Target modules are only imported once a config uses them, so that runs
+# which never touch a target do not pay for importing its SDK
+TARGET_MODULES = {
+    'bintray': 'release_manager.targets.bintray',
+    'awss3': 'release_manager.targets.awss3'
+}
+
+
+def get_target(target_type):
+    """Returns the module implementing a target type, importing it on first use"""
+    if target_type not in TARGET_MODULES:
+        raise ValueError("Invalid target specified; expected one of %s and got %s" % (sorted(TARGET_MODULES.keys()), target_type))
+    return importlib.import_module(TARGET_MODULES[target_type])
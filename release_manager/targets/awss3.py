@@ -22,14 +22,47 @@
 
 from __future__ import division
 
-import tempfile
+import base64
+import binascii
+import functools
+import os
+import re
+import threading
+import time
 
 import boto3
-from boto3.s3.transfer import S3Transfer
-from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import S3Transfer, TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
 
+import release_manager.checksum as checksum
 import release_manager.logger as logger
-import release_manager.package as pack
+import release_manager.retry as retry
+import release_manager.scheduler as scheduler
+
+
+# Options of the target `transfer` section, passed on to boto3 TransferConfig.
+# Sizes are in bytes and max_bandwidth in bytes per second; both accept KB,
+# MB and GB suffixes
+TRANSFER_SIZE_SETTINGS = ['multipart_threshold', 'multipart_chunksize', 'max_bandwidth']
+TRANSFER_SETTINGS = TRANSFER_SIZE_SETTINGS + ['max_concurrency']
+
+PATTERN_SIZE = re.compile(r'^\s*(\d+)\s*(B|KB|MB|GB)?\s*$', re.IGNORECASE)
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+# Artifacts whose digests are not known yet and that are smaller than this
+# (and than the multipart threshold) are read once into memory, hashed and
+# sent with a single request, unless the target sets a max_bandwidth
+MAX_SINGLE_READ_SIZE = 64 * 1024 ** 2
+
+# botocore retries are disabled, so that the retry policy of the target is
+# the only one sending requests again
+CLIENT_CONFIG = Config(retries={'max_attempts': 0})
+
+# Error codes of S3 requests worth sending again
+RETRYABLE_ERROR_CODES = ('SlowDown', 'RequestTimeout', 'InternalError', 'ServiceUnavailable', 'Throttling', 'ThrottlingException')
 
 
 class S3Location(object):
@@ -44,53 +77,374 @@ class S3Location(object):
         return "AWS S3 bucket [{}] at [{}] region. Key [{}]".format(self.bucket, self.region, self.path)
 
 
-def upload_to_s3(args, local, package, target):
-    """Upload artifact to AWS S3"""
+class S3Object(object):
+    """Entity storing the metadata of an object already present in S3"""
+    def __init__(self, key, size, etag):
+        self.key = key
+        self.size = size
+        self.etag = etag.strip('"')
+
+    def __str__(self):
+        return "size {} bytes, ETag {}".format(self.size, self.etag)
 
-    if args.make_artifact:
 
-        # Run build commands
-        if "build_commands" in package.keys():
-            pack.execute_commands(package["build_commands"])
-
-        for artifact in package["artifacts"]:
-            artifact_file = pack.create_artifact(
-                local['root_dir'],
-                package['version'],
-                package['name'],
-                artifact['type'],
-                artifact['prefix'],
-                artifact['suffix'],
-                artifact['binary_paths']
+_clients = {}
+_managers = {}
+_transfers = {}
+_clients_lock = threading.Lock()
+
+# Each (bucket, prefix) has its own lock, so that listing one location never
+# holds up the artifacts of another
+_indexes = {}
+_index_locks = {}
+_indexes_lock = threading.Lock()
+
+
+def get_client(region, target):
+    """Returns the S3 client for a region and set of credentials. Clients are
+    created once and shared by every package and artifact of the run, and
+    never retry requests themselves: `call_s3` does"""
+    key = _client_key(region, target)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = boto3.client(
+                's3',
+                region_name=region,
+                aws_access_key_id=target['access_key_id'],
+                aws_secret_access_key=target['secret_access_key'],
+                config=CLIENT_CONFIG
             )
+        return _clients[key]
 
-            # Process all S3 locations
-            for location in get_locations(package):
-                full_s3_path = get_full_path(location, artifact_file)
 
-                client = boto3.client('s3', region_name=location.region, aws_access_key_id=target['access_key_id'], aws_secret_access_key=target['secret_access_key'])
-                transfer = S3Transfer(client)
+def get_transfer_manager(region, target):
+    """Returns the transfer manager wrapping the shared client of `get_client`,
+    configured with the `transfer` settings of the target. Uploads and copies
+    share its thread pool for the whole run"""
+    client = get_client(region, target)
+    settings = get_transfer_settings(target)
+    key = _client_key(region, target) + tuple(sorted(settings.items()))
+    with _clients_lock:
+        if key not in _managers:
+            _managers[key] = create_transfer_manager(client, TransferConfig(**settings))
+        return _managers[key]
 
-                if package['override']:
-                    transfer.upload_file(artifact_file['artifact_path'], location.bucket, full_s3_path)
-                else:
-                    try:
-                        transfer.download_file(location.bucket, full_s3_path, tempfile.mktemp())
-                        if package['continue_on_conflict']:
-                            logger.log_info("Artifact [%s] exists, but continue_on_conflict flag is true, not failing deploy..." % full_s3_path)
-                        else:
-                            raise ValueError("Artifact at %s already exists" % (full_s3_path,))
-                    except ClientError as e:
-                        if e.response['Error']['Code'] == '404':
-                            transfer.upload_file(artifact_file['artifact_path'], location.bucket, full_s3_path)
-                            logger.log_info("Artifact uploaded to {}".format(location))
-                        else:
-                            logger.log_info("continue_on_conflict flag is true, not failing release...")
-                            raise
 
+def get_transfer(region, target):
+    """Returns the S3Transfer uploading files through `get_transfer_manager`"""
+    manager = get_transfer_manager(region, target)
+    with _clients_lock:
+        if manager not in _transfers:
+            _transfers[manager] = S3Transfer(manager=manager)
+        return _transfers[manager]
+
+
+def get_transfer_settings(target):
+    """Returns the validated `transfer` settings of the target"""
+    settings = target.get('transfer') or {}
+    unknown = set(settings).difference(TRANSFER_SETTINGS)
+    if unknown:
+        raise ValueError("Invalid transfer settings %s; expected any of %s" % (sorted(unknown), TRANSFER_SETTINGS))
+
+    validated = {}
+    for name, value in settings.items():
+        value = parse_size(value) if name in TRANSFER_SIZE_SETTINGS else value
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError("Invalid transfer setting %s; expected a positive number and got %s" % (name, settings[name]))
+        validated[name] = value
+    return validated
+
+
+def parse_size(value):
+    """Returns the number of bytes of a size such as 1024, 64MB or 1 GB"""
+    if isinstance(value, int):
+        return value
+    match = PATTERN_SIZE.match(str(value))
+    if match is None:
+        return value
+    return int(match.group(1)) * SIZE_UNITS[(match.group(2) or 'B').upper()]
+
+
+def _client_key(region, target):
+    return region, target['access_key_id'], target['secret_access_key']
+
+
+def call_s3(target, description, operation):
+    """Runs an S3 operation following the retry policy of the target. Every
+    operation made by this target (listing, HEAD, upload to or copy over a
+    key) is idempotent, so all transient errors are retried"""
+    def attempt():
+        try:
+            return operation()
+        except ClientError as e:
+            metadata = e.response.get('ResponseMetadata', {})
+            if e.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES or metadata.get('HTTPStatusCode') in retry.RETRYABLE_STATUS_CODES:
+                raise retry.RetryableError(str(e), retry.parse_retry_after(metadata.get('HTTPHeaders', {}).get('retry-after')))
+            raise
+        except S3UploadFailedError as e:
+            if any("(%s)" % code in str(e) for code in RETRYABLE_ERROR_CODES):
+                raise retry.RetryableError(str(e))
+            raise
+        except (BotoConnectionError, HTTPClientError) as e:
+            raise retry.RetryableError(str(e))
+    return retry.get_policy(target).call(attempt, description)
+
+
+def get_index(location, target):
+    """Returns the objects stored directly under the location prefix, keyed by
+    S3 key. Every (bucket, prefix) is listed once per run; None is returned when
+    the credentials are not allowed to list the bucket"""
+    prefix = get_prefix(location)
+    key = _client_key(location.region, target) + (location.bucket, prefix)
+    with _indexes_lock:
+        lock = _index_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _indexes:
+            try:
+                _indexes[key] = call_s3(
+                    target,
+                    "Listing of %s" % location,
+                    lambda: list_objects(get_client(location.region, target), location.bucket, prefix)
+                )
+            except ClientError as e:
+                if not is_access_denied(e):
+                    raise
+                logger.log_info("Cannot list %s, checking artifacts one by one" % location)
+                _indexes[key] = None
+        return _indexes[key]
+
+
+def list_objects(client, bucket, prefix):
+    """Lists every object directly under the prefix with a paginated listing"""
+    objects = {}
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for content in page.get('Contents', []):
+            objects[content['Key']] = S3Object(content['Key'], content['Size'], content['ETag'])
+    return objects
+
+
+def prepare(args, package, target):
+    """Validates the S3 locations of the package and indexes the objects
+    already stored there before any artifact is uploaded"""
+    if args.make_artifact:
+        get_transfer_settings(target)
+        for location in get_locations(package):
+            get_index(location, target)
+
+
+def get_transfers(args, package, target, artifacts):
+    """Returns one transfer per artifact and S3 location. Each artifact is
+    uploaded once to the first of the locations it can be copied between;
+    the other locations get a server-side copy of that upload"""
+    transfers = []
+
+    if args.make_artifact:
+        for artifact_file in artifacts:
+            uploads = []
+            for location in get_locations(package):
+                source = find_copy_source(target, uploads, location)
+                if source is None:
+                    transfer = scheduler.Transfer(
+                        target,
+                        "S3 artifact [%s] to %s" % (artifact_file['artifact_name'], location),
+                        functools.partial(upload_to_s3, package, target, artifact_file, location),
+                        artifact=artifact_file,
+                        location=location
+                    )
+                    uploads.append((location, transfer))
+                else:
+                    source_location, source_transfer = source
+                    transfer = scheduler.Transfer(
+                        target,
+                        "S3 artifact [%s] copied to %s" % (artifact_file['artifact_name'], location),
+                        functools.partial(copy_to_s3, package, target, artifact_file, source_location, source_transfer, location),
+                        depends_on=source_transfer,
+                        artifact=artifact_file,
+                        location=location
+                    )
+                transfers.append(transfer)
     else:
         logger.log_info("make-artifact flag was not passed. Do nothing")
 
+    return transfers
+
+
+def find_copy_source(target, uploads, location):
+    """Returns the first (location, transfer) upload that can be copied to the
+    location server-side, or None"""
+    for source in uploads:
+        if can_copy(target, source[0], location):
+            return source
+    return None
+
+
+def can_copy(target, source, destination):
+    """Whether objects are copied server-side between two locations. Copies
+    are made within a region unless `server_side_copy` is false, and between
+    the region pairs listed in `copy_regions`"""
+    if not target.get('server_side_copy', True):
+        return False
+    if source.region == destination.region:
+        return True
+    regions = set([source.region, destination.region])
+    return any(set(pair) == regions for pair in target.get('copy_regions', []))
+
+
+def check_remote(package, target, artifact_file, location):
+    """Returns the status of an artifact that does not need to be stored at
+    the location again, or None if it must be. Raises if another object is
+    already stored at its key and may not be overridden. Artifacts that
+    may be overridden are uploaded when the credentials cannot look up the
+    object already stored"""
+    full_s3_path = get_full_path(location, artifact_file)
+
+    try:
+        remote = find_remote_object(location, target, full_s3_path)
+    except ClientError as e:
+        if not package['override'] or not is_access_denied(e):
+            raise
+        logger.log_info("Cannot check artifact [%s] in %s, uploading it as override flag is true" % (full_s3_path, location))
+        return None
+    if remote is not None and is_up_to_date(location, target, remote, artifact_file['artifact_path']):
+        logger.log_info("Artifact [%s] is up to date in %s, not uploading" % (full_s3_path, location))
+        return scheduler.UP_TO_DATE
+
+    if remote is not None and not package['override']:
+        if package['continue_on_conflict']:
+            logger.log_info("Artifact [%s] exists (%s), but continue_on_conflict flag is true, not failing deploy..." % (full_s3_path, remote))
+            return scheduler.SKIPPED
+        raise ValueError("Artifact at %s already exists (%s)" % (full_s3_path, remote))
+
+    return None
+
+
+def upload_to_s3(package, target, artifact_file, location):
+    """Upload artifact to a single AWS S3 location. Artifacts identical to the
+    object already stored at the key are not uploaded again"""
+    full_s3_path = get_full_path(location, artifact_file)
+
+    status = check_remote(package, target, artifact_file, location)
+    if status is not None:
+        return status
+
+    artifact_path = artifact_file['artifact_path']
+    size = os.path.getsize(artifact_path)
+    digests = checksum.cached_digests(artifact_path)
+    start = time.time()
+    if digests is None and size < get_single_read_size(target):
+        with open(artifact_path, 'rb') as fp:
+            reader = checksum.HashingReader(fp, artifact_path)
+            body = reader.read()
+        digests = reader.digests()
+        call_s3(target, "Upload to %s" % location, lambda: get_client(location.region, target).put_object(
+            Bucket=location.bucket,
+            Key=full_s3_path,
+            Body=body,
+            ContentMD5=base64.b64encode(binascii.unhexlify(digests['md5'])).decode('ascii'),
+            Metadata={'sha256': digests['sha256']}
+        ))
+    else:
+        # The metadata of a multipart upload is sent before its parts, so
+        # the artifact has to be hashed first
+        digests = digests or checksum.file_digests(artifact_path)
+        call_s3(target, "Upload to %s" % location, lambda: get_transfer(location.region, target).upload_file(
+            artifact_path,
+            location.bucket,
+            full_s3_path,
+            extra_args={'Metadata': {'sha256': digests['sha256']}}
+        ))
+    duration = time.time() - start
+    artifact_file['digests'] = digests
+    logger.log_info("Artifact uploaded to {} ({})".format(location, format_throughput(size, duration)))
+    return scheduler.UPLOADED
+
+
+def copy_to_s3(package, target, artifact_file, source_location, source_transfer, location):
+    """Copies an artifact from the location it was uploaded to by another
+    transfer, without sending its content from the runner again. The artifact
+    is uploaded instead if that transfer did not store it at its location"""
+    result = source_transfer.result
+    if result is None or not result.success or result.status not in (scheduler.UPLOADED, scheduler.UP_TO_DATE):
+        logger.log_info("Artifact [%s] is not stored in %s, uploading it instead of copying" % (artifact_file['artifact_name'], source_location))
+        return upload_to_s3(package, target, artifact_file, location)
+
+    full_s3_path = get_full_path(location, artifact_file)
+
+    status = check_remote(package, target, artifact_file, location)
+    if status is not None:
+        return status
+
+    digests = checksum.file_digests(artifact_file['artifact_path'])
+    start = time.time()
+    call_s3(target, "Copy to %s" % location, lambda: get_transfer_manager(location.region, target).copy(
+        {'Bucket': source_location.bucket, 'Key': get_full_path(source_location, artifact_file)},
+        location.bucket,
+        full_s3_path,
+        extra_args={'Metadata': {'sha256': digests['sha256']}, 'MetadataDirective': 'REPLACE'},
+        source_client=get_client(source_location.region, target)
+    ).result())
+    logger.log_info("Artifact copied from {} to {} in {:.2f}s".format(source_location, location, time.time() - start))
+    return scheduler.UPLOADED
+
+
+def get_single_read_size(target):
+    """Returns the size under which artifacts are uploaded in a single request
+    read once from disk. Such requests bypass the transfer manager, so none
+    are made for targets capping their `max_bandwidth`"""
+    settings = get_transfer_settings(target)
+    if 'max_bandwidth' in settings:
+        return 0
+    threshold = settings.get('multipart_threshold', TransferConfig().multipart_threshold)
+    return min(threshold, MAX_SINGLE_READ_SIZE)
+
+
+def format_throughput(size, duration):
+    """Describes the size, duration and achieved throughput of an upload"""
+    megabytes = size / (1024 ** 2)
+    return "%.1f MB in %.2fs, %.1f MB/s" % (megabytes, duration, megabytes / max(duration, 0.001))
+
+
+def is_up_to_date(location, target, remote, artifact_path):
+    """Compares a local artifact with the object stored in S3. The ETag of a
+    single part upload is the MD5 of its content; multipart uploads are
+    compared with the sha256 metadata stored alongside the object"""
+    if remote.size != os.path.getsize(artifact_path):
+        return False
+
+    digests = checksum.file_digests(artifact_path)
+    if '-' not in remote.etag:
+        return remote.etag == digests['md5']
+
+    response = call_s3(target, "HEAD of %s" % remote.key, lambda: get_client(location.region, target).head_object(Bucket=location.bucket, Key=remote.key))
+    return response.get('Metadata', {}).get('sha256') == digests['sha256']
+
+
+def find_remote_object(location, target, key):
+    """Returns the metadata of the object stored at the key from the location
+    index, falling back to a HEAD request if the location cannot be listed"""
+    index = get_index(location, target)
+    if index is None:
+        return call_s3(target, "HEAD of %s" % key, lambda: get_remote_object(get_client(location.region, target), location.bucket, key))
+    return index.get(key)
+
+
+def get_remote_object(client, bucket, key):
+    """Returns the metadata of the object stored at the key with a HEAD
+    request, or None if there is no such object. No content is downloaded"""
+    try:
+        response = client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return S3Object(key, response['ContentLength'], response['ETag'])
+
+
+def is_access_denied(error):
+    """Whether a request failed because the credentials do not allow it"""
+    return error.response['Error']['Code'] in ('403', 'AccessDenied', 'Forbidden')
+
 
 def get_locations(package):
     """Return list of S3 locations extracted from package. Always return array"""
@@ -107,11 +461,14 @@ def get_locations(package):
         raise RuntimeError("Either 'locations' array or 'bucket' must be present")
 
 
-def get_full_path(location, artifact_file):
+def get_prefix(location):
     if location.path.endswith('/'):
-        path = location.path
+        return location.path
     elif not location:
-        path = ''
+        return ''
     else:
-        path = location.path + '/'
-    return path + artifact_file['artifact_name']
+        return location.path + '/'
+
+
+def get_full_path(location, artifact_file):
+    return get_prefix(location) + artifact_file['artifact_name']
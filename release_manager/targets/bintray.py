@@ -22,18 +22,89 @@
 
 from __future__ import division
 
+import functools
 import json
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
 
+import release_manager.checksum as checksum
 import release_manager.logger as logger
-import release_manager.package as pack
+import release_manager.retry as retry
+import release_manager.scheduler as scheduler
+
+
+# --- Constants
+
+
+BINTRAY_API_URL = "https://api.bintray.com"
+
+DEFAULT_POOL_SIZE = 10
+
+
+# --- Sessions
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """Creates a keep-alive HTTP session holding up to `pool_size` connections"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
-def create_bintray_version(version, package, repo, user_org, user, api_key):
+def get_session(target):
+    """Returns the session shared by every request made to the target during
+    this run. The pool is sized by the target `pool_size` and defaults to the
+    number of its transfers run at once, so that parallel uploads never wait
+    on it"""
+    pool_size = target.get('pool_size', target.get('upload_concurrency', DEFAULT_POOL_SIZE))
+    with _sessions_lock:
+        if pool_size not in _sessions:
+            _sessions[pool_size] = create_session(pool_size)
+        return _sessions[pool_size]
+
+
+# --- Functions
+
+
+def send_request(policy, description, send, idempotent=True):
+    """Sends a request following the retry policy. Connection errors and
+    transient response codes are retried; once the attempts run out the
+    last response is returned, or the connection error raised"""
+    def attempt():
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise retry.RetryableError(str(e))
+        if response.status_code in retry.RETRYABLE_STATUS_CODES:
+            raise retry.RetryableError(
+                "HTTP %s" % response.status_code,
+                retry.parse_retry_after(response.headers.get('Retry-After')),
+                response.status_code in retry.REJECTED_STATUS_CODES,
+                response
+            )
+        return response
+
+    try:
+        return (policy or retry.RetryPolicy(max_attempts=1)).call(attempt, description, idempotent)
+    except retry.RetryableError as e:
+        if e.result is None:
+            raise
+        return e.result
+
+
+def create_bintray_version(version, package, repo, user_org, user, api_key, session=requests, policy=None):
     """Creates a new Bintray version for the package"""
     logger.log_start("Creating Bintray version %s in package %s" % (version, package))
 
-    url = "https://api.bintray.com/packages/%s/%s/%s/versions" % (user_org, repo, package)
+    url = "%s/packages/%s/%s/%s/versions" % (BINTRAY_API_URL, user_org, repo, package)
 
     payload = {
         'name': version,
@@ -43,7 +114,12 @@ def create_bintray_version(version, package, repo, user_org, user, api_key):
         'Content-Type': 'application/json'
     }
 
-    response = requests.post(url, data=json.dumps(payload), headers=headers, auth=(user, api_key))
+    # Creating a version twice answers 409, which makes retries harmless
+    response = send_request(
+        policy,
+        "Creation of Bintray version %s" % version,
+        lambda: session.post(url, data=json.dumps(payload), headers=headers, auth=(user, api_key))
+    )
 
     code = response.status_code
     success = False
@@ -64,23 +140,36 @@ def create_bintray_version(version, package, repo, user_org, user, api_key):
     return success
 
 
-def upload_bintray_artifact(version, package, repo, user_org, user, api_key, artifact_name, artifact_path, publish, override, continue_on_conflict):
-    """Uploads the artifact to Bintray"""
+def upload_bintray_artifact(version, package, repo, user_org, user, api_key, artifact_name, artifact_path, publish, override, continue_on_conflict, session=requests, policy=None):
+    """Uploads the artifact to Bintray. Without override, a retried upload
+    that had been stored would conflict, so it is only retried when Bintray
+    rejected it"""
     logger.log_start("Uploading artifact to Bintray")
 
-    url = 'https://api.bintray.com/content/%s/%s/%s/%s/%s' % (user_org, repo, package, version, artifact_name)
+    url = '%s/content/%s/%s/%s/%s/%s' % (BINTRAY_API_URL, user_org, repo, package, version, artifact_name)
     parameters = {
         'publish': publish,
         'override': override
     }
 
-    with open(artifact_path, "rb") as package_fp:
-        response = requests.put(
-            url,
-            auth=(user, api_key),
-            params=parameters,
-            data=package_fp
-        )
+    # The artifact is hashed as it is sent; its checksum can only be sent
+    # along when it was already known
+    headers = {}
+    known = checksum.cached_digests(artifact_path, ('sha256',))
+    if known is not None:
+        headers['X-Checksum-Sha2'] = known['sha256']
+
+    def send():
+        with open(artifact_path, "rb") as package_fp:
+            return session.put(
+                url,
+                auth=(user, api_key),
+                params=parameters,
+                headers=headers,
+                data=checksum.HashingReader(package_fp, artifact_path)
+            )
+
+    response = send_request(policy, "Upload of %s" % artifact_name, send, override == "1")
 
     code = response.status_code
     code_family = int(code) // 100
@@ -101,55 +190,158 @@ def upload_bintray_artifact(version, package, repo, user_org, user, api_key, art
     return success
 
 
-def deploy_to_bintray(args, local, package, target):
-    """Deploys the package to Bintray"""
+def get_version_files(version, package, repo, user_org, user, api_key, session=requests, policy=None):
+    """Returns the files already uploaded to a Bintray version keyed by path,
+    or None if the credentials are not allowed to list them"""
+    url = "%s/packages/%s/%s/%s/versions/%s/files" % (BINTRAY_API_URL, user_org, repo, package, version)
 
-    # Make the version
-    if args.make_version:
-        retval_1 = create_bintray_version(
-            package["version"],
-            package["name"],
-            package["repo"],
-            package["user_org"],
-            target["user"],
-            target["password"]
-        )
-        if retval_1 is False:
-            raise ValueError("Could not create new Bintray version for the package!")
-
-    # Make the artifacts
-    if args.make_artifact:
-
-        # Run build commands
-        if "build_commands" in package.keys():
-            pack.execute_commands(package["build_commands"])
-
-        # Build artifacts
-        for artifact in package["artifacts"]:
-            retval_2 = pack.create_artifact(
-                local["root_dir"],
+    response = send_request(
+        policy,
+        "Listing of Bintray version %s" % version,
+        lambda: session.get(url, params={'include_unpublished': 1}, auth=(user, api_key))
+    )
+
+    if response.status_code == 404:
+        return {}
+    if response.status_code in (401, 403):
+        logger.log_info("Cannot list Bintray version %s, uploading its artifacts without checking them" % version)
+        return None
+    response.raise_for_status()
+    return dict((remote_file['path'], remote_file) for remote_file in response.json())
+
+
+# Versions known to exist, and the transfer creating each version of the run
+_versions = set()
+_version_transfers = {}
+_versions_lock = threading.Lock()
+
+
+def get_version_key(package):
+    return package["user_org"], package["repo"], package["name"], package["version"]
+
+
+# Each version has its own lock, so that listing one version never holds up
+# the uploads of another
+_version_files = {}
+_version_files_locks = {}
+_version_files_lock = threading.Lock()
+
+
+def find_version_file(package, target, artifact_name):
+    """Returns the Bintray file stored under the artifact name, listing the
+    files of each package version only once per run"""
+    key = get_version_key(package)
+    with _version_files_lock:
+        lock = _version_files_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _version_files:
+            _version_files[key] = get_version_files(
                 package["version"],
                 package["name"],
-                artifact["type"],
-                artifact["prefix"],
-                artifact["suffix"],
-                artifact["binary_paths"]
+                package["repo"],
+                package["user_org"],
+                target["user"],
+                target["password"],
+                get_session(target),
+                retry.get_policy(target)
             )
+        if _version_files[key] is None:
+            return None
+        return _version_files[key].get(artifact_name)
+
+
+def prepare(args, package, target):
+    """Nothing to prepare: versions are created by the transfers of
+    `get_transfers`, alongside the uploads"""
+
 
-            # Upload the artifacts
-            if args.make_artifact and args.upload_artifact:
-                retval_3 = upload_bintray_artifact(
-                    package["version"],
-                    package["name"],
-                    package["repo"],
-                    package["user_org"],
-                    target["user"],
-                    target["password"],
-                    retval_2["artifact_name"],
-                    retval_2["artifact_path"],
-                    "1" if package["publish"] else "0",
-                    "1" if package["override"] else "0",
-                    package["continue_on_conflict"]
+def get_transfers(args, package, target, artifacts):
+    """Returns the transfer creating the package version, unless another
+    package of the run already creates it, and one transfer per artifact to
+    upload to Bintray. Uploads only start once their version exists"""
+    transfers = []
+
+    version_transfer = None
+    if args.make_version:
+        with _versions_lock:
+            key = get_version_key(package)
+            version_transfer = _version_transfers.get(key)
+            if version_transfer is None:
+                version_transfer = scheduler.Transfer(
+                    target,
+                    "Bintray version [%s] of package [%s]" % (package["version"], package["name"]),
+                    functools.partial(ensure_version, package, target)
                 )
-                if retval_3 is False:
-                    raise ValueError("Could not upload artifact to Bintray!")
+                _version_transfers[key] = version_transfer
+                transfers.append(version_transfer)
+
+    if args.make_artifact and args.upload_artifact:
+        for artifact_file in artifacts:
+            transfers.append(scheduler.Transfer(
+                target,
+                "Bintray artifact [%s] of package [%s]" % (artifact_file["artifact_name"], package["name"]),
+                functools.partial(deploy_artifact, package, target, artifact_file, version_transfer),
+                depends_on=version_transfer,
+                artifact=artifact_file
+            ))
+
+    return transfers
+
+
+def ensure_version(package, target):
+    """Creates the Bintray version of the package, unless it is already
+    known to exist in this run"""
+    key = get_version_key(package)
+    with _versions_lock:
+        if key in _versions:
+            logger.log_info("Bintray version %s of package %s already exists" % (package["version"], package["name"]))
+            return scheduler.UP_TO_DATE
+
+    retval = create_bintray_version(
+        package["version"],
+        package["name"],
+        package["repo"],
+        package["user_org"],
+        target["user"],
+        target["password"],
+        get_session(target),
+        retry.get_policy(target)
+    )
+    if retval is False:
+        raise ValueError("Could not create new Bintray version for the package!")
+
+    with _versions_lock:
+        _versions.add(key)
+    return scheduler.UPLOADED
+
+
+def deploy_artifact(package, target, artifact_file, version_transfer=None):
+    """Uploads a single artifact of the package to Bintray, unless the file
+    already published under its name has the same checksum"""
+    if version_transfer is not None and not version_transfer.result.success:
+        raise ValueError("Bintray version %s of package %s could not be created" % (package["version"], package["name"]))
+
+    remote = find_version_file(package, target, artifact_file["artifact_name"])
+    if remote is not None and remote.get("sha256") == checksum.file_digests(artifact_file["artifact_path"])["sha256"]:
+        logger.log_info("Artifact [%s] is up to date in Bintray, not uploading" % artifact_file["artifact_name"])
+        return scheduler.UP_TO_DATE
+
+    retval = upload_bintray_artifact(
+        package["version"],
+        package["name"],
+        package["repo"],
+        package["user_org"],
+        target["user"],
+        target["password"],
+        artifact_file["artifact_name"],
+        artifact_file["artifact_path"],
+        "1" if package["publish"] else "0",
+        "1" if package["override"] else "0",
+        package["continue_on_conflict"],
+        get_session(target),
+        retry.get_policy(target)
+    )
+    if retval is False:
+        raise ValueError("Could not upload artifact to Bintray!")
+    artifact_file["digests"] = checksum.file_digests(artifact_file["artifact_path"])
+    return scheduler.UPLOADED
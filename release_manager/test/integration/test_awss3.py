@@ -0,0 +1,220 @@
+"""
+    test_awss3.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import argparse
+import base64
+import hashlib
+import tempfile
+import unittest
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+import release_manager.checksum as checksum
+import release_manager.scheduler as scheduler
+import release_manager.targets.awss3 as s3
+
+
+TARGET = {
+    'type': 'awss3',
+    'access_key_id': 'AKIDEXAMPLE',
+    'secret_access_key': 'secret'
+}
+
+
+class AwsS3Test(unittest.TestCase):
+
+    def test_clients_cached_per_region_and_credentials(self):
+        client = s3.get_client('us-east-1', TARGET)
+        self.assertIs(s3.get_client('us-east-1', dict(TARGET)), client)
+        self.assertIsNot(s3.get_client('us-west-1', TARGET), client)
+        self.assertIsNot(s3.get_client('us-east-1', dict(TARGET, secret_access_key='other')), client)
+
+    def test_clients_leave_retries_to_the_policy(self):
+        client = s3.get_client('us-east-1', TARGET)
+        retries = client.meta.config.retries
+        # Newer botocore releases count the first attempt in total_max_attempts
+        self.assertEqual(retries.get('total_max_attempts', retries.get('max_attempts', 0) + 1), 1)
+
+    def test_transfers_share_cached_client(self):
+        transfer = s3.get_transfer('eu-west-1', TARGET)
+        self.assertIs(s3.get_transfer('eu-west-1', TARGET), transfer)
+
+    def test_copies_share_cached_transfer_manager(self):
+        target = dict(TARGET, access_key_id='AKIDCOPY')
+        source_location = s3.S3Location('source', 'releases', 'us-east-1')
+        location = s3.S3Location('copy', 'releases', 'us-east-1')
+        package = {'override': False, 'continue_on_conflict': False}
+        manager = s3.get_transfer_manager('us-east-1', target)
+        self.assertIs(s3.get_transfer_manager('us-east-1', dict(target)), manager)
+
+        with tempfile.NamedTemporaryFile(suffix='.zip') as artifact:
+            artifact.write(b'copied artifact')
+            artifact.flush()
+            artifact_file = {'artifact_name': 'copied.zip', 'artifact_path': artifact.name}
+            source_transfer = scheduler.Transfer(target, "upload", None)
+            source_transfer.result = scheduler.TransferResult(source_transfer, None, status=scheduler.UPLOADED)
+
+            client = s3.get_client('us-east-1', target)
+            with Stubber(client) as stubber:
+                stubber.add_response('list_objects_v2', {'IsTruncated': False}, {'Bucket': 'copy', 'Prefix': 'releases/', 'Delimiter': '/'})
+                stubber.add_response('head_object', {'ContentLength': 15, 'ETag': '"e"'})
+                stubber.add_response('copy_object', {})
+                status = s3.copy_to_s3(package, target, artifact_file, source_location, source_transfer, location)
+                stubber.assert_no_pending_responses()
+        self.assertEqual(status, scheduler.UPLOADED)
+        self.assertIs(s3.get_transfer_manager('us-east-1', target), manager)
+
+    def test_transfers_cached_per_settings(self):
+        target = dict(TARGET, transfer={'multipart_threshold': '64MB', 'multipart_chunksize': '16 MB', 'max_concurrency': 20})
+        transfer = s3.get_transfer('eu-west-1', target)
+        self.assertIs(s3.get_transfer('eu-west-1', dict(target)), transfer)
+        self.assertIsNot(s3.get_transfer('eu-west-1', TARGET), transfer)
+        self.assertEqual(s3.get_transfer_settings(target), {
+            'multipart_threshold': 64 * 1024 * 1024,
+            'multipart_chunksize': 16 * 1024 * 1024,
+            'max_concurrency': 20
+        })
+
+    def test_invalid_transfer_settings(self):
+        with self.assertRaises(ValueError):
+            s3.get_transfer_settings(dict(TARGET, transfer={'chunk_size': '8MB'}))
+        with self.assertRaises(ValueError):
+            s3.get_transfer_settings(dict(TARGET, transfer={'max_bandwidth': '10 parsecs'}))
+        with self.assertRaises(ValueError):
+            s3.get_transfer_settings(dict(TARGET, transfer={'max_concurrency': 0}))
+
+    def test_single_read_uploads_bounded_by_transfer_settings(self):
+        self.assertEqual(s3.get_single_read_size(TARGET), 8 * 1024 * 1024)
+        self.assertEqual(s3.get_single_read_size(dict(TARGET, transfer={'multipart_threshold': '1GB'})), s3.MAX_SINGLE_READ_SIZE)
+        self.assertEqual(s3.get_single_read_size(dict(TARGET, transfer={'max_bandwidth': '1MB'})), 0)
+
+    def test_copies_to_locations_reachable_from_an_upload(self):
+        args = argparse.Namespace(make_artifact=True)
+        package = {'locations': [
+            {'bucket': 'us-1', 'path': 'js', 'region': 'us-east-1'},
+            {'bucket': 'eu-1', 'path': 'js', 'region': 'eu-west-1'},
+            {'bucket': 'us-2', 'path': 'js', 'region': 'us-east-1'},
+            {'bucket': 'ap-1', 'path': 'js', 'region': 'ap-southeast-1'}
+        ]}
+        artifacts = [{'artifact_name': 'asset.js', 'artifact_path': 'asset.js'}]
+        target = dict(TARGET, copy_regions=[['ap-southeast-1', 'eu-west-1']])
+
+        transfers = s3.get_transfers(args, package, target, artifacts)
+        self.assertEqual([t.depends_on for t in transfers], [None, None, transfers[0], transfers[1]])
+
+        transfers = s3.get_transfers(args, package, dict(target, server_side_copy=False), artifacts)
+        self.assertTrue(all(t.depends_on is None for t in transfers))
+
+    def test_remote_object_uses_head_request(self):
+        client = s3.get_client('us-east-1', TARGET)
+        with Stubber(client) as stubber:
+            stubber.add_response('head_object', {'ContentLength': 42, 'ETag': '"abc123"'}, {'Bucket': 'bucket', 'Key': 'path/artifact.zip'})
+            stubber.add_client_error('head_object', service_error_code='404', http_status_code=404)
+            remote = s3.get_remote_object(client, 'bucket', 'path/artifact.zip')
+            missing = s3.get_remote_object(client, 'bucket', 'path/missing.zip')
+        self.assertEqual((remote.key, remote.size, remote.etag), ('path/artifact.zip', 42, 'abc123'))
+        self.assertIsNone(missing)
+
+    def test_override_uploads_when_remote_cannot_be_checked(self):
+        target = dict(TARGET, access_key_id='AKIDPUTONLY')
+        location = s3.S3Location('bucket', 'releases', 'us-east-1')
+        artifact_file = {'artifact_name': 'a.zip', 'artifact_path': 'a.zip'}
+        client = s3.get_client('us-east-1', target)
+        with Stubber(client) as stubber:
+            stubber.add_client_error('list_objects_v2', service_error_code='AccessDenied', http_status_code=403)
+            stubber.add_client_error('head_object', service_error_code='403', http_status_code=403)
+            stubber.add_client_error('head_object', service_error_code='403', http_status_code=403)
+            self.assertIsNone(s3.check_remote({'override': True}, target, artifact_file, location))
+            with self.assertRaises(ClientError):
+                s3.check_remote({'override': False, 'continue_on_conflict': False}, target, artifact_file, location)
+
+    def test_index_lists_each_location_once(self):
+        target = dict(TARGET, access_key_id='AKIDINDEX')
+        location = s3.S3Location('bucket', 'releases/js', 'us-east-1')
+        client = s3.get_client('us-east-1', target)
+        with Stubber(client) as stubber:
+            stubber.add_response('list_objects_v2', {
+                'Contents': [{'Key': 'releases/js/asset-1.0.0.js', 'Size': 7, 'ETag': '"e7"'}],
+                'IsTruncated': True,
+                'NextContinuationToken': 'next'
+            }, {'Bucket': 'bucket', 'Prefix': 'releases/js/', 'Delimiter': '/'})
+            stubber.add_response('list_objects_v2', {
+                'Contents': [{'Key': 'releases/js/asset-1.0.1.js', 'Size': 9, 'ETag': '"e9"'}],
+                'IsTruncated': False
+            }, {'Bucket': 'bucket', 'Prefix': 'releases/js/', 'Delimiter': '/', 'ContinuationToken': 'next'})
+            first = s3.find_remote_object(location, target, 'releases/js/asset-1.0.0.js')
+            second = s3.find_remote_object(location, target, 'releases/js/asset-1.0.1.js')
+            missing = s3.find_remote_object(location, target, 'releases/js/asset-1.0.2.js')
+            stubber.assert_no_pending_responses()
+        self.assertEqual((first.size, first.etag), (7, 'e7'))
+        self.assertEqual((second.size, second.etag), (9, 'e9'))
+        self.assertIsNone(missing)
+
+    def test_up_to_date_compares_content(self):
+        location = s3.S3Location('bucket', 'releases', 'us-east-1')
+        with tempfile.NamedTemporaryFile(suffix='.zip') as artifact:
+            artifact.write(b'artifact content')
+            artifact.flush()
+            md5 = hashlib.md5(b'artifact content').hexdigest()
+            sha256 = hashlib.sha256(b'artifact content').hexdigest()
+
+            same = s3.S3Object('releases/a.zip', 16, '"%s"' % md5)
+            changed = s3.S3Object('releases/a.zip', 16, '"%s"' % hashlib.md5(b'other').hexdigest())
+            resized = s3.S3Object('releases/a.zip', 17, '"%s"' % md5)
+            multipart = s3.S3Object('releases/a.zip', 16, '"0123456789abcdef-2"')
+
+            self.assertTrue(s3.is_up_to_date(location, TARGET, same, artifact.name))
+            self.assertFalse(s3.is_up_to_date(location, TARGET, changed, artifact.name))
+            self.assertFalse(s3.is_up_to_date(location, TARGET, resized, artifact.name))
+
+            client = s3.get_client('us-east-1', TARGET)
+            with Stubber(client) as stubber:
+                stubber.add_response('head_object', {'Metadata': {'sha256': sha256}}, {'Bucket': 'bucket', 'Key': 'releases/a.zip'})
+                self.assertTrue(s3.is_up_to_date(location, TARGET, multipart, artifact.name))
+
+    def test_small_artifact_read_once_and_verified(self):
+        target = dict(TARGET, access_key_id='AKIDPUT')
+        location = s3.S3Location('bucket', 'releases', 'us-east-1')
+        package = {'override': False, 'continue_on_conflict': False}
+        with tempfile.NamedTemporaryFile(suffix='.zip') as artifact:
+            artifact.write(b'small artifact')
+            artifact.flush()
+            artifact_file = {'artifact_name': 'small.zip', 'artifact_path': artifact.name}
+            md5 = hashlib.md5(b'small artifact')
+            sha256 = hashlib.sha256(b'small artifact').hexdigest()
+
+            client = s3.get_client('us-east-1', target)
+            with Stubber(client) as stubber:
+                stubber.add_response('list_objects_v2', {'IsTruncated': False}, {'Bucket': 'bucket', 'Prefix': 'releases/', 'Delimiter': '/'})
+                stubber.add_response('put_object', {'ETag': '"%s"' % md5.hexdigest()}, {
+                    'Bucket': 'bucket',
+                    'Key': 'releases/small.zip',
+                    'Body': b'small artifact',
+                    'ContentMD5': base64.b64encode(md5.digest()).decode('ascii'),
+                    'Metadata': {'sha256': sha256}
+                })
+                s3.upload_to_s3(package, target, artifact_file, location)
+                stubber.assert_no_pending_responses()
+
+            self.assertEqual(artifact_file['digests'], {'md5': md5.hexdigest(), 'sha256': sha256})
+            self.assertEqual(checksum.cached_digests(artifact.name)['sha256'], sha256)
@@ -0,0 +1,149 @@
+"""
+    test_bintray.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import release_manager.checksum as checksum
+import release_manager.targets.bintray as bintray
+from release_manager.scheduler import Transfer, TransferResult, UP_TO_DATE
+
+
+TARGET = {
+    'type': 'bintray',
+    'user': 'user',
+    'password': 'password'
+}
+
+
+class FakeSession(object):
+    """Reads the uploaded data the way requests does and answers 201"""
+    def __init__(self):
+        self.headers = []
+
+    def put(self, url, auth, params, headers, data):
+        self.headers.append(dict(headers))
+        while data.read(8192):
+            pass
+        return FakeResponse()
+
+
+class FakeResponse(object):
+    status_code = 201
+    headers = {}
+
+
+class ForbiddenSession(object):
+    """Answers every request with 403"""
+    def get(self, url, params, auth):
+        response = FakeResponse()
+        response.status_code = 403
+        return response
+
+
+def get_package(name, version="0.1.0"):
+    return {'name': name, 'version': version, 'repo': 'generic', 'user_org': 'org'}
+
+
+class BintrayTest(unittest.TestCase):
+
+    def test_uploads_depend_on_their_version(self):
+        args = argparse.Namespace(make_version=True, make_artifact=True, upload_artifact=True)
+        package = get_package("versioned")
+        artifacts = [{'artifact_name': 'a.zip', 'artifact_path': 'a.zip'}, {'artifact_name': 'b.zip', 'artifact_path': 'b.zip'}]
+
+        version, first, second = bintray.get_transfers(args, package, TARGET, artifacts)
+        self.assertIsNone(version.depends_on)
+        self.assertEqual([first.depends_on, second.depends_on], [version, version])
+
+        # Another target releasing the same version reuses the same creation
+        again = bintray.get_transfers(args, package, dict(TARGET), artifacts)
+        self.assertEqual([transfer.depends_on for transfer in again], [version, version])
+
+    def test_known_versions_not_requested_again(self):
+        package = get_package("known", "1.0.0")
+        bintray._versions.add(bintray.get_version_key(package))
+        self.assertEqual(bintray.ensure_version(package, TARGET), UP_TO_DATE)
+
+    def test_upload_fails_without_version(self):
+        version = Transfer(TARGET, "version", None)
+        version.result = TransferResult(version, ValueError("HTTP 500"))
+        with self.assertRaises(ValueError):
+            bintray.deploy_artifact(get_package("failed"), TARGET, {'artifact_name': 'a.zip', 'artifact_path': 'a.zip'}, version)
+
+    def test_artifact_hashed_while_uploading(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            artifact_path = os.path.join(work_dir, "artifact.zip")
+            with open(artifact_path, "wb") as stream:
+                stream.write(b"artifact content" * 1000)
+            self.assertIsNone(checksum.cached_digests(artifact_path))
+
+            session = FakeSession()
+            for _ in range(2):
+                bintray.upload_bintray_artifact("0.1.0", "package", "generic", "org", "user", "key", "artifact.zip", artifact_path, "0", "0", False, session)
+
+            expected = hashlib.sha256(b"artifact content" * 1000).hexdigest()
+            self.assertEqual(checksum.cached_digests(artifact_path)["sha256"], expected)
+            self.assertEqual(session.headers, [{}, {'X-Checksum-Sha2': expected}])
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_slow_listing_does_not_hold_up_other_versions(self):
+        release = threading.Event()
+        default_get_version_files = bintray.get_version_files
+
+        def get_version_files(version, *args):
+            if version == "slow":
+                release.wait(5)
+            return {'%s.zip' % version: {'sha256': version}}
+
+        bintray.get_version_files = get_version_files
+        try:
+            slow = threading.Thread(target=bintray.find_version_file, args=(get_package("listed", "slow"), TARGET, "slow.zip"))
+            slow.start()
+            self.assertEqual(bintray.find_version_file(get_package("listed", "fast"), TARGET, "fast.zip"), {'sha256': 'fast'})
+            self.assertTrue(slow.is_alive())
+        finally:
+            release.set()
+            slow.join()
+            bintray.get_version_files = default_get_version_files
+
+    def test_forbidden_listing_does_not_fail_uploads(self):
+        self.assertIsNone(bintray.get_version_files("0.1.0", "package", "generic", "org", "user", "key", ForbiddenSession()))
+
+        default_get_version_files = bintray.get_version_files
+        bintray.get_version_files = lambda *args: None
+        try:
+            self.assertIsNone(bintray.find_version_file(get_package("forbidden"), TARGET, "a.zip"))
+        finally:
+            bintray.get_version_files = default_get_version_files
+
+    def test_session_pool_sized_to_concurrent_transfers(self):
+        session = bintray.get_session(dict(TARGET, upload_concurrency=16))
+        self.assertEqual(session.get_adapter("https://api.bintray.com")._pool_maxsize, 16)
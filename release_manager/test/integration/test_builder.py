@@ -0,0 +1,83 @@
+"""
+    test_builder.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from release_manager.builder import run_builds, validate_dependencies
+
+
+class BuilderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.root_dir, 'order.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def package(self, name, depends_on=None, command=None):
+        package = {
+            'name': name,
+            'build_commands': [command or 'sleep 0.1 && echo %s >> %s' % (name, self.log_path)]
+        }
+        if depends_on is not None:
+            package['depends_on'] = depends_on
+        return package
+
+    def built(self):
+        with open(self.log_path) as log:
+            return [line.strip() for line in log]
+
+    def test_dependencies_build_first(self):
+        run_builds(self.root_dir, [
+            self.package('app', ['core', 'utils']),
+            self.package('utils', ['core']),
+            self.package('core')
+        ], 4)
+        self.assertEqual(self.built(), ['core', 'utils', 'app'])
+
+    def test_independent_packages_build_concurrently(self):
+        packages = [self.package(name, command='sleep 0.5') for name in ('a', 'b', 'c', 'd')]
+        start = time.time()
+        run_builds(self.root_dir, packages, 4)
+        self.assertLess(time.time() - start, 1.5)
+
+    def test_failure_aborts_running_builds(self):
+        start = time.time()
+        with self.assertRaises(ValueError):
+            run_builds(self.root_dir, [
+                self.package('slow', command='sleep 30'),
+                self.package('broken', command='exit 1'),
+                self.package('after', ['broken'])
+            ], 2)
+        self.assertLess(time.time() - start, 10)
+        self.assertFalse(os.path.exists(self.log_path))
+
+    def test_invalid_dependencies(self):
+        with self.assertRaises(ValueError):
+            validate_dependencies([self.package('a', ['missing'])])
+        with self.assertRaises(ValueError):
+            validate_dependencies([self.package('a', ['b']), self.package('b', ['a'])])
@@ -25,6 +25,7 @@ import release_manager._version as _version
 import release_manager.utils as utils
 import os
 import sys
+import tempfile
 
 
 # --- Helpers
@@ -140,6 +141,25 @@ class IntegrationTest(unittest.TestCase):
         os.environ["TRAVIS_TAG"] = _version.__version__
 
 
+    def test_integration_check_version_loads_no_target(self):
+        """Test that --check-version does not import the target SDKs"""
+        cwd = os.environ["TRAVIS_BUILD_DIR"]
+
+        retval = process_output(
+            utils.execute([
+                "python", "-W", "ignore", "-c",
+                "import sys; sys.argv = sys.argv[1:]; import release_manager.__main__ as m; m.main(); "
+                "sys.stderr.write(' '.join(n for n in ('boto3', 'requests') if n in sys.modules))",
+                "release-manager",
+                "--config",
+                "%s/resources/integration/good.yml" % cwd,
+                "--check-version"
+            ], None, True, cwd=cwd)
+        )
+        self.assertEquals(retval['code'], 0)
+        self.assertEquals(retval['stderr'], "")
+
+
     def test_integration_make_artifact(self):
         """Test running main with --config & --make-artifact"""
         cwd = os.environ["TRAVIS_BUILD_DIR"]
@@ -165,3 +185,29 @@ class IntegrationTest(unittest.TestCase):
             ], None, True)
         )
         self.assertEquals(retval['code'], 1)
+
+
+    def test_integration_make_artifact_builds_once_for_all_targets(self):
+        """Test that each package is built once, whatever its number of targets"""
+        cwd = os.environ["TRAVIS_BUILD_DIR"]
+        build_log = tempfile.NamedTemporaryFile(suffix='.log', delete=False)
+        build_log.close()
+        os.environ["BUILD_LOG"] = build_log.name
+
+        try:
+            retval = process_output(
+                utils.execute([
+                    "python", "-W", "ignore",
+                    "%s/release_manager/__main__.py" % cwd,
+                    "--config",
+                    "%s/resources/integration/two_targets.yml" % cwd,
+                    "--make-artifact"
+                ], None, True)
+            )
+            self.assertEquals(retval['code'], 0)
+
+            with open(build_log.name) as log:
+                self.assertEquals(sorted(log.read().split()), ["release-manager", "release-manager-docs"])
+        finally:
+            os.remove(build_log.name)
+            del os.environ["BUILD_LOG"]
@@ -0,0 +1,102 @@
+"""
+    test_journal.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import release_manager.journal as journal
+from release_manager.scheduler import Transfer, UPLOADED, SKIPPED
+
+
+# --- Tests
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.root_dir, "config.yml")
+        with open(self.config_path, "w") as stream:
+            stream.write("packages: []\n")
+        self.artifact_path = os.path.join(self.root_dir, "artifact.zip")
+        with open(self.artifact_path, "w") as stream:
+            stream.write("content")
+        self.artifact = {'artifact_name': 'artifact.zip', 'artifact_path': self.artifact_path}
+        self.package = {'name': 'package', 'version': '0.1.0'}
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def get_transfers(self, target, calls):
+        return [
+            Transfer(target, "first", lambda: calls.append("first"), artifact=self.artifact, location="first"),
+            Transfer(target, "second", lambda: calls.append("second") or SKIPPED, artifact=self.artifact, location="second")
+        ]
+
+    def test_resumed_run_skips_completed_transfers(self):
+        target = {'type': 'awss3'}
+        calls = []
+        release_journal = journal.open_journal(self.root_dir, self.config_path, [self.package])
+        transfers = journal.resume_transfers(release_journal, self.package, 0, self.get_transfers(target, calls))
+        transfers[0].action()
+        self.assertEqual(calls, ["first"])
+
+        resumed = journal.open_journal(self.root_dir, self.config_path, [self.package], resume=True)
+        transfers = self.get_transfers(target, calls)
+        pending = journal.resume_transfers(resumed, self.package, 0, transfers)
+        self.assertEqual(pending, [transfers[1]])
+        self.assertEqual(transfers[0].result.status, UPLOADED)
+
+        # A later run that does not resume starts over
+        fresh = journal.open_journal(self.root_dir, self.config_path, [self.package])
+        self.assertEqual(len(journal.resume_transfers(fresh, self.package, 0, self.get_transfers(target, calls))), 2)
+
+    def test_changed_artifact_is_sent_again(self):
+        target = {'type': 'bintray'}
+        release_journal = journal.open_journal(self.root_dir, self.config_path, [self.package])
+        for transfer in journal.resume_transfers(release_journal, self.package, 0, self.get_transfers(target, [])):
+            transfer.action()
+
+        with open(self.artifact_path, "w") as stream:
+            stream.write("changed content")
+        resumed = journal.open_journal(self.root_dir, self.config_path, [self.package], resume=True)
+        self.assertEqual(len(journal.resume_transfers(resumed, self.package, 0, self.get_transfers(target, []))), 2)
+
+    def test_journal_keyed_by_package_versions(self):
+        path = journal.get_journal_path(self.root_dir, self.config_path, [self.package])
+        self.assertEqual(path, journal.get_journal_path(self.root_dir, self.config_path, [dict(self.package)]))
+        self.assertNotEqual(path, journal.get_journal_path(self.root_dir, self.config_path, [dict(self.package, version='0.2.0')]))
+
+    def test_completed_dependencies_still_pending(self):
+        packages = [
+            {'name': 'core', 'version': '1'},
+            {'name': 'app', 'version': '1', 'depends_on': ['core']},
+            {'name': 'docs', 'version': '1'}
+        ]
+        release_journal = journal.Journal(os.path.join(self.root_dir, "journal.json"), packages=['core', 'docs'])
+        self.assertEqual([p['name'] for p in journal.get_pending_packages(release_journal, packages)], ['core', 'app'])
+
+        release_journal.complete(packages[1])
+        self.assertEqual(journal.get_pending_packages(release_journal, packages), [])
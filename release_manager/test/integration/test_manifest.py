@@ -0,0 +1,80 @@
+"""
+    test_manifest.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import release_manager.checksum as checksum
+import release_manager.manifest as manifest
+from release_manager.planner import PackagePlan
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def create_artifact(self, name, content):
+        path = os.path.join(self.root_dir, name)
+        with open(path, "wb") as stream:
+            stream.write(content)
+        return {'artifact_name': name, 'artifact_path': path}
+
+    def test_manifests_uploaded_with_artifacts(self):
+        first = self.create_artifact("first.zip", b"first" * 100000)
+        empty = self.create_artifact("empty.txt", b"")
+        plan = PackagePlan({'name': 'package', 'version': '0.1.0', 'checksums': ['sha256', 'sha512']}, [first, empty])
+        untouched = PackagePlan({'name': 'other', 'version': '0.1.0'}, [self.create_artifact("other.zip", b"other")])
+
+        manifest.create_manifests(self.root_dir, [plan, untouched], threads=4)
+
+        self.assertEqual([a['artifact_name'] for a in plan.artifacts], [
+            'first.zip', 'empty.txt', 'package_0.1.0_SHA256SUMS', 'package_0.1.0_SHA512SUMS'
+        ])
+        self.assertEqual(len(untouched.artifacts), 1)
+        with open(plan.artifacts[2]['artifact_path']) as stream:
+            self.assertEqual(stream.read(), "%s  empty.txt\n%s  first.zip\n" % (
+                hashlib.sha256(b"").hexdigest(),
+                hashlib.sha256(b"first" * 100000).hexdigest()
+            ))
+        with open(plan.artifacts[3]['artifact_path']) as stream:
+            self.assertIn("%s  first.zip\n" % hashlib.sha512(b"first" * 100000).hexdigest(), stream.read())
+
+        # The digests the targets need are known without reading the files again
+        self.assertEqual(checksum.cached_digests(first['artifact_path']), {
+            'md5': hashlib.md5(b"first" * 100000).hexdigest(),
+            'sha256': hashlib.sha256(b"first" * 100000).hexdigest()
+        })
+
+    def test_checksums_option(self):
+        self.assertEqual(manifest.get_algorithms({'name': 'p'}), [])
+        self.assertEqual(manifest.get_algorithms({'name': 'p', 'checksums': True}), ['sha256'])
+        self.assertEqual(manifest.get_algorithms({'name': 'p', 'checksums': 'sha512'}), ['sha512'])
+        with self.assertRaises(ValueError):
+            manifest.get_algorithms({'name': 'p', 'checksums': ['crc32']})
@@ -20,8 +20,13 @@
 """
 
 
+import os
+import shutil
+import tempfile
 import unittest
-from release_manager.package import create_artifact
+import zipfile
+import release_manager.archive as zip_writer
+from release_manager.package import create_artifact, execute_build
 
 
 class PackageTest(unittest.TestCase):
@@ -40,3 +45,121 @@ class PackageTest(unittest.TestCase):
             'artifact_path': './dist/kinesis-sink/test_package_0.4.0.zip'
         })
 
+
+    def test_zip_artifact_streams_sources_without_changing_cwd(self):
+        cwd = os.getcwd()
+        result = create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-stored', ['setup.py', 'README.rst'], 0)
+        self.assertEqual(os.getcwd(), cwd)
+        with zipfile.ZipFile(result['artifact_path']) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['README.rst', 'setup.py'])
+            with open('setup.py', 'rb') as source:
+                self.assertEqual(archive.read('setup.py'), source.read())
+
+    def test_zip_artifact_rejects_invalid_compression_level(self):
+        with self.assertRaises(ValueError):
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-bad', ['setup.py'], 10)
+
+    def test_zip_artifact_warns_when_level_cannot_be_applied(self):
+        messages = []
+        default_log_info = zip_writer.logger.log_info
+        supported = zip_writer.SUPPORTS_COMPRESSION_LEVEL
+        zip_writer.SUPPORTS_COMPRESSION_LEVEL = False
+        zip_writer.logger.log_info = messages.append
+        try:
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-level', ['setup.py'], 9, 'deflate')
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-level', ['setup.py'], 6, 'deflate')
+        finally:
+            zip_writer.SUPPORTS_COMPRESSION_LEVEL = supported
+            zip_writer.logger.log_info = default_log_info
+        self.assertEqual(len([message for message in messages if "compression level 9" in message]), 1)
+
+    def test_zip_artifact_rejects_missing_binary(self):
+        with self.assertRaises(ValueError) as context:
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-missing', ['setup.py', 'no/such/binary.jar'])
+        self.assertIn("no such file", str(context.exception))
+
+    def test_zip_artifact_stores_incompressible_members(self):
+        random_path = './dist/random.bin'
+        with open(random_path, 'wb') as random_file:
+            random_file.write(os.urandom(256 * 1024))
+        try:
+            result = create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-auto', ['setup.py', 'dist/random.bin'])
+            with zipfile.ZipFile(result['artifact_path']) as archive:
+                self.assertEqual(archive.getinfo('setup.py').compress_type, zipfile.ZIP_DEFLATED)
+                self.assertEqual(archive.getinfo('random.bin').compress_type, zipfile.ZIP_STORED)
+
+            result = create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-store', ['setup.py'], None, 'store')
+            with zipfile.ZipFile(result['artifact_path']) as archive:
+                self.assertEqual(archive.getinfo('setup.py').compress_type, zipfile.ZIP_STORED)
+        finally:
+            os.remove(random_path)
+
+    def test_zip_artifact_reused_when_inputs_unchanged(self):
+        source_path = './dist/cached-input.txt'
+        with open(source_path, 'w') as source:
+            source.write('first')
+        try:
+            first = create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-cached', ['dist/cached-input.txt'])
+            built_at = os.stat(first['artifact_path']).st_mtime
+
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-cached', ['dist/cached-input.txt'])
+            self.assertEqual(os.stat(first['artifact_path']).st_mtime, built_at)
+
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-cached', ['dist/cached-input.txt'], 9)
+            self.assertNotEqual(os.stat(first['artifact_path']).st_mtime, built_at)
+            built_at = os.stat(first['artifact_path']).st_mtime
+
+            with open(source_path, 'w') as source:
+                source.write('second')
+            create_artifact('.', '0.4.0', "kinesis-sink", 'zip', 'test-package-', '-cached', ['dist/cached-input.txt'], 9)
+            with zipfile.ZipFile(first['artifact_path']) as archive:
+                self.assertEqual(archive.read('cached-input.txt'), b'second')
+        finally:
+            os.remove(source_path)
+
+    def test_build_skipped_when_inputs_unchanged(self):
+        root_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root_dir, 'input.txt'), 'w') as source:
+                source.write('v1')
+            package = {
+                'name': 'cached-build',
+                'build_commands': ['cd %s && echo built >> runs.log && touch output.jar' % root_dir],
+                'build_inputs': ['*.txt'],
+                'build_outputs': ['output.jar']
+            }
+
+            def runs():
+                with open(os.path.join(root_dir, 'runs.log')) as log:
+                    return len(log.readlines())
+
+            execute_build(root_dir, package)
+            execute_build(root_dir, package)
+            self.assertEqual(runs(), 1)
+
+            os.remove(os.path.join(root_dir, 'output.jar'))
+            execute_build(root_dir, package)
+            self.assertEqual(runs(), 2)
+
+            with open(os.path.join(root_dir, 'input.txt'), 'w') as source:
+                source.write('v2')
+            execute_build(root_dir, package)
+            self.assertEqual(runs(), 3)
+        finally:
+            shutil.rmtree(root_dir)
+
+    def test_build_fails_when_an_input_pattern_matches_nothing(self):
+        root_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(root_dir, 'input.txt'), 'w') as source:
+                source.write('v1')
+            package = {
+                'name': 'mistyped-build',
+                'build_commands': ['touch %s/output.jar' % root_dir],
+                'build_inputs': ['*.txt', 'src/**/*.scala']
+            }
+            with self.assertRaises(ValueError):
+                execute_build(root_dir, package)
+            self.assertFalse(os.path.exists(os.path.join(root_dir, 'output.jar')))
+        finally:
+            shutil.rmtree(root_dir)
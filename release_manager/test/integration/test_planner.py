@@ -0,0 +1,95 @@
+"""
+    test_planner.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import release_manager.planner as planner
+
+
+class PlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            with open(os.path.join(self.root_dir, name), 'w') as stream:
+                stream.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def create_package(self, name, binaries):
+        return {
+            'name': name,
+            'version': '0.1.0',
+            'build_commands': [],
+            'artifacts': [
+                {'type': 'zip', 'prefix': '%s-%s-' % (name, binary[0]), 'suffix': '', 'binary_paths': [binary]}
+                for binary in binaries
+            ]
+        }
+
+    def test_artifacts_created_in_job_order(self):
+        packages = [self.create_package('first', ['a.txt', 'b.txt']), self.create_package('second', ['c.txt'])]
+        jobs = [job for package in packages for job in planner.get_artifact_jobs({'root_dir': self.root_dir}, package)]
+
+        artifacts = planner.create_artifacts(jobs, processes=3)
+
+        self.assertEqual([artifact['artifact_name'] for artifact in artifacts], [
+            'first_a_0.1.0.zip', 'first_b_0.1.0.zip', 'second_c_0.1.0.zip'
+        ])
+        for artifact, member in zip(artifacts, ['a.txt', 'b.txt', 'c.txt']):
+            with zipfile.ZipFile(artifact['artifact_path']) as archive:
+                self.assertEqual(archive.namelist(), [member])
+
+    def test_plan_splits_artifacts_per_package(self):
+        args = argparse.Namespace(make_artifact=True, jobs=1)
+        local = {'root_dir': self.root_dir, 'artifact_concurrency': 2}
+        packages = [
+            self.create_package('first', ['a.txt']),
+            self.create_package('second', ['b.txt', 'c.txt']),
+            self.create_package('third', ['a.txt'])
+        ]
+
+        plans = planner.create_plan(args, local, packages)
+
+        self.assertEqual([plan.package['name'] for plan in plans], ['first', 'second', 'third'])
+        self.assertEqual([[artifact['artifact_name'] for artifact in plan.artifacts] for plan in plans], [
+            ['first_a_0.1.0.zip'],
+            ['second_b_0.1.0.zip', 'second_c_0.1.0.zip'],
+            ['third_a_0.1.0.zip']
+        ])
+
+    def test_artifacts_of_a_package_share_a_new_staging_folder(self):
+        package = self.create_package('shared', ['a.txt', 'b.txt', 'c.txt'] * 3)
+        for index, artifact in enumerate(package['artifacts']):
+            artifact['prefix'] += '%s-' % index
+        jobs = planner.get_artifact_jobs({'root_dir': self.root_dir}, package)
+
+        artifacts = planner.create_artifacts(jobs, processes=len(jobs))
+
+        self.assertEqual(len(artifacts), 9)
+        self.assertTrue(all(os.path.isfile(artifact['artifact_path']) for artifact in artifacts))
@@ -0,0 +1,110 @@
+"""
+    test_retry.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+
+import unittest
+
+import release_manager.retry as retry
+from release_manager.scheduler import Transfer, TransferScheduler
+
+
+# --- Helpers
+
+
+class FlakyOperation(object):
+    """Fails with a RetryableError a given number of times, then succeeds"""
+    def __init__(self, failures, rejected=False, retry_after=None):
+        self.failures = failures
+        self.rejected = rejected
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise retry.RetryableError("HTTP 503", self.retry_after, self.rejected)
+        return "done"
+
+
+# --- Tests
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+
+    def get_policy(self, **settings):
+        return retry.RetryPolicy(sleep=self.sleeps.append, **settings)
+
+    def test_retries_until_success(self):
+        operation = FlakyOperation(2)
+        self.assertEqual(self.get_policy(max_attempts=3).call(operation, "operation"), "done")
+        self.assertEqual(operation.calls, 3)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_gives_up_after_max_attempts(self):
+        operation = FlakyOperation(5)
+        with self.assertRaises(retry.RetryableError):
+            self.get_policy(max_attempts=3).call(operation, "operation")
+        self.assertEqual(operation.calls, 3)
+
+    def test_non_idempotent_only_retried_when_rejected(self):
+        operation = FlakyOperation(1)
+        with self.assertRaises(retry.RetryableError):
+            self.get_policy().call(operation, "operation", idempotent=False)
+        self.assertEqual(operation.calls, 1)
+
+        operation = FlakyOperation(1, rejected=True)
+        self.assertEqual(self.get_policy().call(operation, "operation", idempotent=False), "done")
+
+    def test_full_jitter_backoff(self):
+        policy = self.get_policy(backoff_base=1.0, backoff_cap=5.0)
+        for attempt, backoff in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)]:
+            delay = policy.get_delay(attempt)
+            self.assertTrue(0 <= delay <= backoff)
+        self.assertEqual(self.get_policy(backoff_base=1.0, backoff_cap=5.0, jitter=False).get_delay(3), 4.0)
+
+    def test_retry_after_respected(self):
+        operation = FlakyOperation(1, retry_after=7)
+        self.get_policy(backoff_cap=1.0).call(operation, "operation")
+        self.assertEqual(self.sleeps, [7])
+        self.assertEqual(retry.parse_retry_after("120"), 120)
+        self.assertEqual(retry.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412470), 10)
+        self.assertIsNone(retry.parse_retry_after("soon"))
+
+    def test_policy_from_target(self):
+        policy = retry.get_policy({'retry': {'max_attempts': 5, 'backoff_cap': 10}})
+        self.assertEqual((policy.max_attempts, policy.backoff_cap), (5, 10))
+        self.assertEqual(retry.get_policy({}).max_attempts, retry.DEFAULT_MAX_ATTEMPTS)
+        with self.assertRaises(ValueError):
+            retry.get_policy({'retry': {'attempts': 5}})
+
+    def test_retries_counted_per_transfer(self):
+        target = {'type': 'awss3'}
+        policy = self.get_policy(max_attempts=5)
+        results = TransferScheduler(2).run([
+            Transfer(target, "flaky", lambda: policy.call(FlakyOperation(3), "flaky")),
+            Transfer(target, "steady", lambda: policy.call(FlakyOperation(0), "steady"))
+        ])
+        self.assertEqual([r.retries for r in results], [3, 0])
+        self.assertIn("3 retries", str(results[0]))
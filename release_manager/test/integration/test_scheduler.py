@@ -0,0 +1,132 @@
+"""
+    test_scheduler.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import threading
+import time
+import unittest
+
+from release_manager.scheduler import Transfer, TransferScheduler, limit_targets
+
+
+# --- Helpers
+
+
+class ConcurrencyProbe(object):
+    """Records the highest number of actions running at the same time"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def action(self):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+
+
+def fail():
+    raise ValueError("Boom")
+
+
+# --- Tests
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_results_in_submission_order(self):
+        target = {'type': 'bintray'}
+        transfers = [Transfer(target, "transfer %s" % i, lambda: None) for i in range(10)]
+        results = TransferScheduler(4).run(transfers)
+        self.assertEqual([r.transfer for r in results], transfers)
+        self.assertTrue(all(r.success for r in results))
+
+    def test_failures_reported_per_transfer(self):
+        target = {'type': 'awss3'}
+        results = TransferScheduler(2).run([
+            Transfer(target, "good", lambda: None),
+            Transfer(target, "bad", fail)
+        ])
+        self.assertTrue(results[0].success)
+        self.assertFalse(results[1].success)
+        self.assertEqual(str(results[1].error), "Boom")
+
+    def test_global_concurrency_limit(self):
+        probe = ConcurrencyProbe()
+        target = {'type': 'awss3'}
+        TransferScheduler(3).run([Transfer(target, "t", probe.action) for _ in range(9)])
+        self.assertEqual(probe.peak, 3)
+
+    def test_per_target_concurrency_limit(self):
+        limited_probe = ConcurrencyProbe()
+        other_probe = ConcurrencyProbe()
+        limited = {'type': 'bintray', 'upload_concurrency': 1}
+        other = {'type': 'awss3'}
+        transfers = [Transfer(limited, "l", limited_probe.action) for _ in range(4)]
+        transfers += [Transfer(other, "o", other_probe.action) for _ in range(4)]
+        TransferScheduler(4).run(transfers)
+        self.assertEqual(limited_probe.peak, 1)
+        self.assertLessEqual(other_probe.peak, 3)
+
+    def test_invalid_target_concurrency_limit(self):
+        target = {'type': 'bintray', 'upload_concurrency': 0}
+        with self.assertRaises(ValueError):
+            TransferScheduler(2).run([Transfer(target, "t", lambda: None)])
+
+    def test_targets_limited_by_overall_concurrency(self):
+        targets = [{'type': 'bintray'}, {'type': 'bintray', 'upload_concurrency': 32}, {'type': 'awss3', 'upload_concurrency': 2}]
+        limit_targets(targets, 16)
+        self.assertEqual([target['upload_concurrency'] for target in targets], [16, 16, 2])
+
+    def test_dependent_transfer_runs_after_its_dependency(self):
+        target = {'type': 'awss3'}
+        finished = []
+
+        def upload():
+            time.sleep(0.05)
+            finished.append("upload")
+
+        source = Transfer(target, "upload", upload)
+        copies = [Transfer(target, "copy", lambda: finished.append(source.result.status), depends_on=source) for _ in range(3)]
+        results = TransferScheduler(4).run(copies + [source])
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual(finished, ["upload", "uploaded", "uploaded", "uploaded"])
+
+    def test_dependency_must_be_scheduled(self):
+        target = {'type': 'awss3'}
+        source = Transfer(target, "upload", lambda: None)
+        with self.assertRaises(ValueError):
+            TransferScheduler(2).run([Transfer(target, "copy", lambda: None, depends_on=source)])
+
+    def test_dependencies_start_first(self):
+        target = {'type': 'bintray'}
+        started = []
+        transfers = []
+        for package in ["a", "b", "c"]:
+            version = Transfer(target, package, lambda package=package: started.append(package))
+            transfers.append(version)
+            transfers += [Transfer(target, "upload", lambda: started.append("upload"), depends_on=version) for _ in range(3)]
+        results = TransferScheduler(1).run(transfers)
+        self.assertEqual(started[:3], ["a", "b", "c"])
+        self.assertEqual([r.transfer for r in results], transfers)
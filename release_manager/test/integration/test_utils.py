@@ -0,0 +1,160 @@
+"""
+    test_utils.py
+
+    Copyright (c) 2016 Snowplow Analytics Ltd. All rights reserved.
+
+    This program is licensed to you under the Apache License Version 2.0,
+    and you may not use this file except in compliance with the Apache License
+    Version 2.0. You may obtain a copy of the Apache License Version 2.0 at
+    http://www.apache.org/licenses/LICENSE-2.0.
+
+    Unless required by applicable law or agreed to in writing,
+    software distributed under the Apache License Version 2.0 is distributed on
+    an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+    express or implied. See the Apache License Version 2.0 for the specific
+    language governing permissions and limitations there under.
+
+    Authors: Joshua Beemster
+    Copyright: Copyright (c) 2016 Snowplow Analytics Ltd
+    License: Apache License Version 2.0
+"""
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import yaml
+
+import release_manager.utils as utils
+
+
+class UtilsTest(unittest.TestCase):
+
+    def test_execute_keeps_bounded_tail_on_failure(self):
+        command = 'for i in $(seq 1 1000); do echo "line $i" >&2; done; exit 3'
+        with self.assertRaises(ValueError) as context:
+            utils.execute([command], shell=True, quiet=True)
+        lines = str(context.exception).splitlines()
+        self.assertEqual(len(lines), utils.OUTPUT_TAIL_LINES)
+        self.assertEqual(lines[-1], "line 1000")
+
+    def test_execute_returns_duration(self):
+        duration = utils.execute(['sleep 0.2 && echo done'], shell=True, quiet=True)
+        self.assertGreaterEqual(duration, 0.2)
+
+    def test_only_isolated_commands_get_their_own_process_group(self):
+        output = utils.execute(['sleep 5'], None, quiet=True, shell=True)
+        try:
+            self.assertEqual(os.getpgid(output.pid), os.getpgrp())
+        finally:
+            output.kill()
+            output.wait()
+
+        groups = utils.execute(['sleep 0.1'], lambda output: (output.pid, os.getpgid(output.pid), output.wait()), quiet=True, shell=True, isolate=True)
+        self.assertEqual(groups[0], groups[1])
+        self.assertEqual(utils._running, {})
+
+    def test_parse_config_in_memory_and_repeatable(self):
+        os.environ["RELEASE_MANAGER_TEST_DIR"] = "/tmp/build"
+        with tempfile.NamedTemporaryFile('w', suffix='.yml', delete=False) as config:
+            config.write("vars:\n  file: VERSION\n"
+                         "root_dir: <%= ENV['RELEASE_MANAGER_TEST_DIR'] %>/sub\n"
+                         "version: <%= CMD['echo {{ vars.file }}'] %>\n")
+        try:
+            first = utils.parse_config(config.name)
+            second = utils.parse_config(config.name)
+            self.assertFalse(os.path.exists("%s.tmp" % config.name))
+        finally:
+            os.remove(config.name)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['root_dir'], "/tmp/build/sub")
+        self.assertEqual(first['version'].strip(), "VERSION")
+        self.assertEqual(yaml.safe_load("value: <%= ENV['RELEASE_MANAGER_TEST_DIR'] %>"),
+                         {'value': "<%= ENV['RELEASE_MANAGER_TEST_DIR'] %>"})
+
+    def test_placeholder_after_template_expression(self):
+        os.environ["RELEASE_MANAGER_TEST_VERSION"] = "1.2.3"
+        with tempfile.NamedTemporaryFile('w', suffix='.yml', delete=False) as config:
+            config.write("vars:\n  suffix: -rc1\n"
+                         "version: \"{{ vars.suffix }}<%= ENV['RELEASE_MANAGER_TEST_VERSION'] %>\"\n")
+        try:
+            result = utils.parse_config(config.name)
+        finally:
+            os.remove(config.name)
+
+        self.assertEqual(result['version'], "-rc11.2.3")
+
+    def test_placeholders_evaluated_once_and_concurrently(self):
+        counter_path = tempfile.mktemp()
+        with tempfile.NamedTemporaryFile('w', suffix='.yml', delete=False) as config:
+            config.write("a: <%%= CMD['echo run >> %s && echo 1'] %%>\n" % counter_path)
+            config.write("b: <%%= CMD['echo run >> %s && echo 1'] %%>\n" % counter_path)
+            config.write("c: v<%= CMD['sleep 0.5 && echo 2'] %>\n")
+            config.write("d: <%= CMD['sleep 0.5 && echo 3'] %>\n")
+        try:
+            start = time.time()
+            result = utils.parse_config(config.name)
+            elapsed = time.time() - start
+            with open(counter_path) as counter:
+                runs = len(counter.readlines())
+        finally:
+            os.remove(config.name)
+            os.remove(counter_path)
+
+        self.assertEqual(runs, 1)
+        self.assertEqual(result['a'], result['b'])
+        self.assertEqual(result['c'].strip(), "v2")
+        self.assertLess(elapsed, 0.9)
+
+    def test_sbt_version_read_from_build_files(self):
+        project = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(project, 'build.sbt'), 'w') as build:
+                build.write('lazy val root = project\n  .settings(\n    version := "0.3.0",\n  )\n')
+            with open(os.path.join(project, 'version.sbt'), 'w') as version:
+                version.write('version in ThisBuild := "1.2.3-M1"\n')
+            self.assertEqual(utils.sbt_version(project), "1.2.3-M1")
+
+            os.remove(os.path.join(project, 'version.sbt'))
+            self.assertEqual(utils.sbt_version(project), "0.3.0")
+        finally:
+            shutil.rmtree(project)
+
+    def test_sbt_version_cached_per_commit(self):
+        project = tempfile.mkdtemp()
+        default_cache = utils.SBT_VERSION_CACHE
+        default_run = utils.run_sbt_version
+        utils.SBT_VERSION_CACHE = os.path.join(project, '.cache', 'sbt_version.json')
+        calls = []
+        utils.run_sbt_version = lambda directory: calls.append(directory) or "0.1.0-%s" % len(calls)
+
+        def git(*args):
+            utils.execute(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args), None, quiet=True, cwd=project).communicate()
+
+        try:
+            with open(os.path.join(project, '.gitignore'), 'w') as ignore:
+                ignore.write('.cache\n')
+            with open(os.path.join(project, 'build.sbt'), 'w') as build:
+                build.write('enablePlugins(GitVersioning)\n')
+            git('init', '-q')
+            git('add', '-A')
+            git('commit', '-q', '-m', 'first')
+
+            self.assertEqual(utils.sbt_version(project), "0.1.0-1")
+            self.assertEqual(utils.sbt_version(project), "0.1.0-1")
+
+            git('commit', '-q', '--allow-empty', '-m', 'second')
+            self.assertEqual(utils.sbt_version(project), "0.1.0-2")
+
+            with open(os.path.join(project, 'build.sbt'), 'a') as build:
+                build.write('// uncommitted\n')
+            self.assertEqual(utils.sbt_version(project), "0.1.0-3")
+            self.assertEqual(utils.sbt_version(project), "0.1.0-4")
+        finally:
+            utils.run_sbt_version = default_run
+            utils.SBT_VERSION_CACHE = default_cache
+            shutil.rmtree(project)
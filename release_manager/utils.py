@@ -19,24 +19,34 @@
     License: Apache License Version 2.0
 """
 
+import collections
 import contextlib
+import glob
 import os
+import signal
 import subprocess
+import sys
 import random
 import string
 import threading
 import re
 import time
+from multiprocessing.pool import ThreadPool
 
 from jinja2 import Template
 import yaml
 from yaml.loader import SafeLoader
 
+import release_manager.cache as cache
 import release_manager.logger as logger
 
 
 # --- Command Execution
 
+
+OUTPUT_TAIL_LINES = 200
+
+
 @contextlib.contextmanager
 def working_directory(path):
     """A context manager which changes the working directory to the given
@@ -49,14 +59,37 @@ def working_directory(path):
     os.chdir(prev_cwd)
 
 
-def output_everything(output):
-    """Callback to log stdout"""
-    (stdout, stderr) = output.communicate()
+def output_everything(output, prefix=None):
+    """Callback logging stdout and stderr line by line while the process runs.
+    Only the last OUTPUT_TAIL_LINES lines of each are kept in memory, for the
+    failure message. Returns how long the process took in seconds"""
+    start = time.time()
+    stdout_tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    stderr_tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+
+    stderr_reader = threading.Thread(target=stream_lines, args=(output.stderr, stderr_tail, prefix))
+    stderr_reader.daemon = True
+    stderr_reader.start()
+    stream_lines(output.stdout, stdout_tail, prefix)
+    stderr_reader.join()
+    output.wait()
+
+    duration = time.time() - start
     if output.returncode == 0:
-        logger.log_output(stdout)
+        logger.log_output("Took %.2fs" % duration, prefix)
+        return duration
     else:
-        logger.log_output("Process has failed.\n" + stdout.decode("utf-8"))
-        raise ValueError(stderr)
+        logger.log_output("Process has failed with code %s after %.2fs." % (output.returncode, duration), prefix)
+        raise ValueError("\n".join(stderr_tail or stdout_tail))
+
+
+def stream_lines(stream, tail, prefix=None):
+    """Logs every line of a stream as soon as it is read, keeping the tail"""
+    for line in iter(stream.readline, b''):
+        line = line.decode("utf-8", "replace").rstrip("\r\n")
+        tail.append(line)
+        logger.log_output(line, prefix)
+    stream.close()
 
 
 def output_value(output, fail_on_err=False):
@@ -71,52 +104,178 @@ def output_value(output, fail_on_err=False):
             return stderr
 
 
-def execute(command, callback=output_everything, quiet=False, shell=False):
-    """Execute shell command with optional callback"""
+# Commands being executed with a callback, mapped to whether they run in
+# their own process group
+_running = {}
+_running_lock = threading.Lock()
+
+
+def execute(command, callback=output_everything, quiet=False, shell=False, cwd=None, isolate=False):
+    """Execute shell command with optional callback. Isolated commands run in
+    their own process group, so that terminating them also terminates
+    whatever their shell started; they must be given a callback"""
     if not quiet:
         formatted_command = " ".join(command) if (type(command) == list) else command
         logger.log_info("Executing [{0}]".format(formatted_command))
 
-    output = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell)
+    if isolate and not hasattr(callback, '__call__'):
+        raise ValueError("Isolated commands must be executed with a callback")
+
+    options = {}
+    if isolate and sys.version_info >= (3, 2):
+        options['start_new_session'] = True
+    elif isolate and hasattr(os, 'setpgrp'):
+        options['preexec_fn'] = os.setpgrp
+    output = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell, cwd=cwd, **options)
 
     if hasattr(callback, '__call__'):
-        return callback(output)
+        with _running_lock:
+            _running[output] = isolate
+        try:
+            return callback(output)
+        except BaseException:
+            # Isolated commands do not receive the terminal Ctrl-C
+            if isolate:
+                _terminate(output, isolate)
+            raise
+        finally:
+            with _running_lock:
+                _running.pop(output, None)
     else:
         return output
 
 
+def _terminate(output, isolated):
+    if output.poll() is not None:
+        return
+    try:
+        if isolated and hasattr(os, 'killpg'):
+            os.killpg(output.pid, signal.SIGTERM)
+        else:
+            output.terminate()
+    except OSError:
+        pass
+
+
+def terminate_running():
+    """Terminates every command currently being executed with a callback"""
+    with _running_lock:
+        for output, isolated in _running.items():
+            _terminate(output, isolated)
+
+
 class AwakeThread(threading.Thread):
     """Thread printing messages to console, keeping Travis CI from shut down prematurely"""
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.stopped = threading.Event()
+
     def run(self):
         print("Starting AwakeThread")
         count = 0
-        while count < 10:
+        while count < 10 and not self.stopped.is_set():
             message = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(128))
             print("Tick %s. %s seconds passed. Random output: %s" % (str(count), str(40 * count), message))
-            time.sleep(40)
+            self.stopped.wait(40)
             count = count + 1
         print("Exit AwakeThread")
 
+    def stop(self):
+        self.stopped.set()
+
+
+SBT_VERSION_CACHE = os.path.join(os.path.expanduser("~"), ".release-manager", "sbt_version.json")
+
+# Build files whose changes can change the version of an sbt project
+SBT_VERSION_INPUTS = ['version.sbt', 'build.sbt', 'project/*.sbt', 'project/*.scala', 'project/build.properties']
+
+PATTERN_SBT_VERSION = re.compile(r'^\s*(?:ThisBuild\s*/\s*)?version(?:\s+in\s+ThisBuild)?\s*:=\s*"([^"]+)"', re.MULTILINE)
+
+_sbt_version_lock = threading.Lock()
+
 
 def sbt_version(directory):
-    """Return version of project in some directory"""
+    """Return version of project in some directory. The version is read from
+    version.sbt or build.sbt when it is a literal, and only asked to sbt
+    otherwise. Versions given by sbt are cached across runs, keyed by the
+    build files and the git state of the project that plugins such as
+    sbt-git or sbt-dynver derive versions from. They are not cached while
+    the working tree has uncommitted changes"""
+    project = os.path.abspath(directory)
+    version = read_sbt_version(project)
+    if version is not None:
+        return version
+
+    state = git_state(project)
+    if state is not None and state.endswith("-dirty"):
+        return run_sbt_version(project)
+
+    key = [[path, os.path.getmtime(path)] for pattern in SBT_VERSION_INPUTS
+           for path in sorted(glob.glob(os.path.join(project, pattern)))] + [state]
+
+    with _sbt_version_lock:
+        cached = (cache.load_manifest(SBT_VERSION_CACHE) or {}).get(project)
+    if cached is not None and cached.get('key') == key:
+        return cached['version']
+
+    version = run_sbt_version(project)
+
+    with _sbt_version_lock:
+        store = cache.load_manifest(SBT_VERSION_CACHE) or {}
+        store[project] = {'key': key, 'version': version}
+        if not os.path.isdir(os.path.dirname(SBT_VERSION_CACHE)):
+            os.makedirs(os.path.dirname(SBT_VERSION_CACHE))
+        cache.save_manifest(SBT_VERSION_CACHE, store)
+    return version
+
+
+def git_state(directory):
+    """Returns the nearest tag, distance and commit of the git HEAD of a
+    directory, suffixed with -dirty when there are uncommitted changes, or
+    None if the directory is not in a git repository"""
+    try:
+        output = execute(['git', 'describe', '--tags', '--long', '--always', '--dirty'], None, quiet=True, cwd=directory)
+    except OSError:
+        return None
+    (stdout, _) = output.communicate()
+    if output.returncode != 0:
+        return None
+    return _to_text(stdout).strip()
+
+
+def read_sbt_version(directory):
+    """Returns the literal version declared in version.sbt or build.sbt, or
+    None if there is none or the declarations disagree"""
+    for build_file in ['version.sbt', 'build.sbt']:
+        path = os.path.join(directory, build_file)
+        if os.path.isfile(path):
+            with open(path, 'r') as stream:
+                versions = set(PATTERN_SBT_VERSION.findall(stream.read()))
+            if len(versions) == 1:
+                return versions.pop()
+            elif len(versions) > 1:
+                return None
+    return None
+
+
+def run_sbt_version(directory):
+    """Return version of project in some directory by asking sbt"""
     t = AwakeThread()
-    t.setDaemon(True)
+    t.daemon = True
     t.start()
 
-    with working_directory(directory):
-        sbt_output = execute(['sbt', '-no-colors', 'version'], None)
-        print(sbt_output.stderr.read())
-        for line in sbt_output.stdout.read().split("\n"):
-            print(line)
-            match = re.search('\[info\]\s*(\d+\.\d+\.\d+.*)$', line)
-            if match:
-                return match.group(1)
-        raise ValueError("Not SBT Project: " + directory)
-
-    t.join()
-    print("Some result should appear")
-
+    try:
+        sbt_output = execute(['sbt', '-no-colors', 'version'], None, cwd=directory)
+        (stdout, stderr) = sbt_output.communicate()
+    finally:
+        t.stop()
+    print(_to_text(stderr))
+    for line in _to_text(stdout).split("\n"):
+        print(line)
+        match = re.search(r'\[info\]\s*(\d+\.\d+\.\d+.*)$', line)
+        if match:
+            return match.group(1)
+    raise ValueError("Not SBT Project: " + directory)
 
 
 PREDEFINED_FUNCTIONS = {
@@ -125,67 +284,133 @@ PREDEFINED_FUNCTIONS = {
 
 # --- Config
 
-def parse_config(config_path):
-    """Checks if secrets need to be fetched from the environment"""
 
-    temp_path = "%s.tmp" % config_path
+PATTERN_ENV = re.compile(r'^(.*)\<%= ENV\[\'(.*)\'\] %\>(.*)$')
 
-    # Template yaml file
-    with open(config_path, 'r') as stream:
-        try:
-            temp = template_yaml(yaml.safe_load(stream))
-        except yaml.YAMLError as exc:
-            raise ValueError("Invalid config passed to the program: %s" % exc)
+PATTERN_CMD = re.compile(r'^(.*)\<%= CMD\[\'(.*)\'\] %\>(.*)$')
+
+PATTERN_FUN = re.compile(r'^(.*)\<%= FUNC\[\'(.*)\((.*)\)\'\] %\>(.*)$')
+
+MAX_PLACEHOLDER_THREADS = 8
 
-    # Dump templated file back to file-system
-    with open(temp_path, 'w') as outfile:
-        yaml.safe_dump(temp, outfile, default_flow_style=False)
-
-    # Add environment resolver
-    pattern_env = re.compile(r'^(.*)\<%= ENV\[\'(.*)\'\] %\>(.*)$')
-    yaml.add_implicit_resolver("!pathex", pattern_env, None, SafeLoader)
-
-    # Add command resolver
-    pattern_cmd = re.compile(r'^(.*)\<%= CMD\[\'(.*)\'\] %\>(.*)$')
-    yaml.add_implicit_resolver("!pathcmd", pattern_cmd, None, SafeLoader)
-
-    # Add function resolver
-    pattern_fun = re.compile(r'^(.*)\<%= FUNC\[\'(.*)\((.*)\)\'\] %\>(.*)$')
-    yaml.add_implicit_resolver("!func", pattern_fun, None, SafeLoader)
-
-    def pathex_constructor(loader, node):
-        """Processes environment variables found in the YAML"""
-        value = loader.construct_scalar(node)
-        before_path, env_var, remaining_path = pattern_env.match(value).groups()
-        return before_path + os.environ[env_var] + remaining_path
-
-    def pathcmd_constructor(loader, node):
-        """Processes command variables found in the YAML"""
-        value = loader.construct_scalar(node)
-        before_path, cmd_var, remaining_path = pattern_cmd.match(value).groups()
-        retval = output_value(execute(cmd_var, None, True, True), True)
-        return before_path + retval.decode("utf-8") + remaining_path
-
-    def fun_constructor(loader, node):
-        """Processes embedded functions found in the YAML"""
-        value = loader.construct_scalar(node)
-        before_path, fun, arg, remaining_path = pattern_fun.match(value).groups()
-        retval = PREDEFINED_FUNCTIONS[fun](arg)
-        return before_path + retval.decode("utf-8") + remaining_path
-
-    yaml.add_constructor("!pathex", pathex_constructor, SafeLoader)
-    yaml.add_constructor("!pathcmd", pathcmd_constructor, SafeLoader)
-    yaml.add_constructor("!func", fun_constructor, SafeLoader)
-
-    with open(temp_path, 'r') as stream:
+
+class ConfigLoader(SafeLoader):
+    """Safe YAML loader which also resolves the ENV, CMD and FUNC placeholders
+    of a config. Resolvers are registered once on this class, leaving the
+    global SafeLoader untouched. Each distinct CMD or FUNC placeholder is only
+    evaluated once per load"""
+    def __init__(self, stream):
+        SafeLoader.__init__(self, stream)
+        self.resolved = {}
+
+    def evaluate(self, placeholder):
+        if placeholder not in self.resolved:
+            self.resolved[placeholder] = resolve_placeholder(placeholder)
+        return self.resolved[placeholder]
+
+
+def _to_text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def resolve_placeholder(placeholder):
+    """Evaluates a ('CMD', command) or ('FUNC', function, argument) placeholder"""
+    if placeholder[0] == "CMD":
+        return _to_text(output_value(execute(placeholder[1], None, True, True), True))
+    else:
+        return _to_text(PREDEFINED_FUNCTIONS[placeholder[1]](placeholder[2]))
+
+
+def collect_placeholders(node):
+    """Returns the distinct CMD and FUNC placeholders found under a node"""
+    placeholders = set()
+    visited = set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if id(current) in visited:
+            continue
+        visited.add(id(current))
+        if isinstance(current, yaml.ScalarNode):
+            if current.tag == "!pathcmd":
+                placeholders.add(("CMD", PATTERN_CMD.match(current.value).group(2)))
+            elif current.tag == "!func":
+                placeholders.add(("FUNC",) + PATTERN_FUN.match(current.value).groups()[1:3])
+        elif isinstance(current, yaml.SequenceNode):
+            stack.extend(current.value)
+        elif isinstance(current, yaml.MappingNode):
+            for key, value in current.value:
+                stack.extend([key, value])
+    return placeholders
+
+
+def resolve_placeholders(placeholders):
+    """Evaluates the placeholders concurrently, returning their values"""
+    placeholders = sorted(placeholders)
+    if len(placeholders) <= 1:
+        return dict((placeholder, resolve_placeholder(placeholder)) for placeholder in placeholders)
+
+    pool = ThreadPool(min(len(placeholders), MAX_PLACEHOLDER_THREADS))
+    try:
+        return dict(zip(placeholders, pool.map(resolve_placeholder, placeholders)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def pathex_constructor(loader, node):
+    """Processes environment variables found in the YAML"""
+    value = loader.construct_scalar(node)
+    before_path, env_var, remaining_path = PATTERN_ENV.match(value).groups()
+    return before_path + os.environ[env_var] + remaining_path
+
+
+def pathcmd_constructor(loader, node):
+    """Processes command variables found in the YAML"""
+    value = loader.construct_scalar(node)
+    before_path, cmd_var, remaining_path = PATTERN_CMD.match(value).groups()
+    return before_path + loader.evaluate(("CMD", cmd_var)) + remaining_path
+
+
+def fun_constructor(loader, node):
+    """Processes embedded functions found in the YAML"""
+    value = loader.construct_scalar(node)
+    before_path, fun, arg, remaining_path = PATTERN_FUN.match(value).groups()
+    return before_path + loader.evaluate(("FUNC", fun, arg)) + remaining_path
+
+
+ConfigLoader.add_implicit_resolver("!pathex", PATTERN_ENV, None)
+ConfigLoader.add_implicit_resolver("!pathcmd", PATTERN_CMD, None)
+ConfigLoader.add_implicit_resolver("!func", PATTERN_FUN, None)
+
+ConfigLoader.add_constructor("!pathex", pathex_constructor)
+ConfigLoader.add_constructor("!pathcmd", pathcmd_constructor)
+ConfigLoader.add_constructor("!func", fun_constructor)
+
+
+def parse_config(config_path):
+    """Loads the config, rendering it through Jinja2 and then resolving its
+    placeholders. Everything happens in memory, and the distinct CMD and FUNC
+    placeholders are all evaluated concurrently before the config is built"""
+    with open(config_path, 'r') as stream:
         try:
-            return yaml.safe_load(stream)
+            # The rendered YAML is loaded and dumped again so that scalars
+            # quoted in it become plain, as placeholders only resolve there
+            rendered = yaml.safe_load(template_yaml(yaml.safe_load(stream)))
+            loader = ConfigLoader(yaml.safe_dump(rendered, default_flow_style=False))
+            try:
+                node = loader.get_single_node()
+                if node is None:
+                    return None
+                loader.resolved = resolve_placeholders(collect_placeholders(node))
+                return loader.construct_document(node)
+            finally:
+                loader.dispose()
         except yaml.YAMLError as exc:
             raise ValueError("Invalid config passed to the program: %s" % exc)
 
 
 def template_yaml(yaml_dict):
-    """Runs the YAML through the Jinja2 templater"""
+    """Runs the YAML through the Jinja2 templater, returning the rendered YAML"""
     template_yaml_dict = Template(yaml.safe_dump(yaml_dict, default_flow_style=False))
-    template_rendered = template_yaml_dict.render(yaml_dict)
-    return yaml.safe_load(template_rendered)
+    return template_yaml_dict.render(yaml_dict)